@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# exit codes 0-success, 1-operation error, 2-condition error
+prog_desc='''Local stand-in for the parts of the Digital Ocean v2 API that
+harbor-wave uses. Droplets, tags, domains/records, projects, images, sizes,
+regions, ssh keys, account and balance. Keeps everything in memory, counts
+every call, and can add latency, small page sizes, rate limits and ETags so
+harbor-wave can be benchmarked without touching a real account.
+
+point harbor-wave at it with:
+DIGITALOCEAN_END_POINT=http://127.0.0.1:PORT/v2/
+
+GET /_stats returns call counts as JSON, POST /_reset clears counts, and
+POST /_reset?all=1 clears droplets too
+'''
+
+import sys,time
+import argparse
+import json
+import hashlib
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+class fake_state:
+    '''in-memory account, shared between handler threads'''
+    def __init__(self,opts):
+        self.lock        = threading.Lock()
+        self.opts        = opts
+        self.next_id     = 1000
+        self.droplets    = {}
+        self.records     = {}
+        self.calls       = {}
+        self.total_calls = 0
+        # times of requests in the last rate-window, oldest first
+        self.window      = deque()
+        self.domains     = ["example.com"]
+        self.regions     = ["nyc1","nyc3","sfo3","ams3","fra1"]
+        self.sizes       = {"s-1vcpu-1gb":0.00893,"s-2vcpu-2gb":0.02679}
+        self.images      = [{"id":1234,"name":"test-template","type":"custom","distribution":"Arch","slug":None,"public":False,"regions":["nyc1","nyc3","sfo3"],"min_disk_size":10,"size_gigabytes":2,"created_at":"2024-01-01T00:00:00Z"}]
+        self.keys        = [{"id":1,"name":"bench-key","fingerprint":"3b:16:bf:e4:8b:00:8b:b8:59:8c:a9:d3:f0:19:45:fa","public_key":"ssh-rsa AAAA"}]
+        self.projects    = [{"id":"4e1bfbc3-dc3e-41f2-a18f-1b4d7ba71679","name":"bench","description":"","purpose":"","environment":"Development","is_default":False}]
+        for i in range(opts.records):
+            self.add_record("example.com","filler" + str(i),"192.0.2.1")
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def add_record(self,domain,name,data,rtype="A"):
+        record = {"id":self.new_id(),"type":rtype,"name":name,"data":data,"ttl":1800,"priority":None,"port":None,"weight":None,"flags":None,"tag":None}
+        self.records[record['id']] = dict(record,domain=domain)
+        return record
+
+    def count(self,method,path):
+        # collapse ids so the counts group per endpoint
+        parts = []
+        for part in path.split("/"):
+            if part.isdigit():
+                part = "{id}"
+            parts.append(part)
+        key = method + " " + "/".join(parts)
+        with self.lock:
+            self.calls[key]   = self.calls.get(key,0) + 1
+            self.total_calls += 1
+
+    def take_token(self):
+        '''returns remaining requests, or -1 if rate limited, and reset time.
+        A rolling window, like Digital Ocean. Each request counts against the
+        limit for rate-window seconds after it was made, and reset is when the
+        oldest one in the window stops counting'''
+        now = time.time()
+        if self.opts.rate_limit <= 0:
+            return 5000,now
+        with self.lock:
+            while len(self.window) > 0 and now - self.window[0] >= self.opts.rate_window:
+                self.window.popleft()
+            if len(self.window) >= self.opts.rate_limit:
+                return -1,self.window[0] + self.opts.rate_window
+            self.window.append(now)
+            return self.opts.rate_limit - len(self.window),self.window[0] + self.opts.rate_window
+
+    def droplet_json(self,droplet):
+        out = dict(droplet)
+        out['networks'] = {"v4":[],"v6":[]}
+        if time.time() - droplet['_born'] >= self.opts.ip_delay:
+            n = droplet['id']
+            out['networks']['v4'] = [
+              {"ip_address":"10.%d.%d.%d" % ((n >> 16) & 255,(n >> 8) & 255,n & 255),"type":"private","netmask":"255.255.0.0","gateway":""},
+              {"ip_address":"198.%d.%d.%d" % ((n >> 16) & 255,(n >> 8) & 255,n & 255),"type":"public","netmask":"255.255.0.0","gateway":""},
+            ]
+        out['status'] = "active" if out['networks']['v4'] else "new"
+        del(out['_born'])
+        return out
+
+    def new_droplet(self,name,body):
+        size_slug = body.get("size")
+        droplet = {
+            "id"         : self.new_id(),
+            "name"       : name,
+            "memory"     : 1024,
+            "vcpus"      : 1,
+            "disk"       : 25,
+            "locked"     : False,
+            "created_at" : time.strftime("%Y-%m-%dT%H:%M:%SZ",time.gmtime()),
+            "features"   : [],
+            "region"     : {"slug":body.get("region"),"name":body.get("region")},
+            "size"       : {"slug":size_slug,"price_hourly":self.sizes.get(size_slug,0.01)},
+            "size_slug"  : size_slug,
+            "image"      : {"id":body.get("image"),"name":"test-template"},
+            "tags"       : body.get("tags") or [],
+            "user_data"  : body.get("user_data"),
+            "_born"      : time.time(),
+        }
+        self.droplets[droplet['id']] = droplet
+        return droplet
+
+class fake_handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self,*args):
+        return
+
+    def reply(self,code,data=None,extra_headers={}):
+        body = b""
+        if data != None:
+            body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(body)))
+        for key in extra_headers:
+            self.send_header(key,extra_headers[key])
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length == 0:
+            return {}
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw.decode())
+        except ValueError:
+            return {}
+
+    def paged(self,key,items,query):
+        '''slice a list the way the API paginates it'''
+        per_page = int(query.get("per_page",["20"])[0])
+        per_page = min(per_page,self.server.state.opts.page_size)
+        page     = int(query.get("page",["1"])[0])
+        start    = (page - 1) * per_page
+        out      = {key:items[start:start + per_page],"links":{},"meta":{"total":len(items)}}
+        if start + per_page < len(items):
+            next_query = dict((k,v[0]) for k,v in query.items())
+            next_query['page']     = page + 1
+            next_query['per_page'] = per_page
+            query_str = "&".join("%s=%s" % (k,v) for k,v in next_query.items())
+            out['links'] = {"pages":{"next":"http://%s:%s%s?%s" % (self.server.server_address[0],self.server.server_address[1],urlparse(self.path).path,query_str)}}
+        return out
+
+    def handle_any(self,method):
+        state = self.server.state
+        url   = urlparse(self.path)
+        query = parse_qs(url.query)
+        path  = url.path.rstrip("/")
+
+        if path == "/_stats":
+            with state.lock:
+                return self.reply(200,{"total":state.total_calls,"calls":state.calls,"droplets":len(state.droplets)})
+        if path == "/_reset":
+            with state.lock:
+                state.calls       = {}
+                state.total_calls = 0
+                if "all" in query:
+                    state.droplets = {}
+            return self.reply(204)
+
+        if not path.startswith("/v2/"):
+            return self.reply(404,{"id":"not_found","message":"no such path"})
+        path = path[4:]
+        state.count(method,path)
+
+        # always read the body, even for a 429, or it is left on the
+        # keep-alive connection and garbles the next request
+        body      = self.read_body()
+        remaining,reset = state.take_token()
+        limit_headers = {"RateLimit-Limit":str(state.opts.rate_limit or 5000),"RateLimit-Remaining":str(max(remaining,0)),"RateLimit-Reset":str(int(reset) + 1)}
+        if remaining < 0:
+            limit_headers['Retry-After'] = "1"
+            return self.reply(429,{"id":"too_many_requests","message":"API Rate limit exceeded."},limit_headers)
+        if state.opts.latency > 0:
+            time.sleep(state.opts.latency / 1000)
+
+        parts = path.split("/")
+        code, data = self.route(method,parts,query,body)
+        # conditional GETs, 304 if nothing changed since the client's ETag
+        if method == "GET" and code == 200 and state.opts.etag == True:
+            etag = '"' + hashlib.sha1(json.dumps(data,sort_keys=True).encode()).hexdigest() + '"'
+            limit_headers['ETag'] = etag
+            if self.headers.get("If-None-Match") == etag:
+                return self.reply(304,None,limit_headers)
+        return self.reply(code,data,limit_headers)
+
+    def route(self,method,parts,query,body):
+        state = self.server.state
+        with state.lock:
+            if parts == ["account"]:
+                return 200,{"account":{"droplet_limit":1000,"email":"bench@example.com","uuid":"x","email_verified":True,"status":"active"}}
+            if parts == ["customers","my","balance"]:
+                return 200,{"month_to_date_balance":"-50.00","account_balance":"-100.00","month_to_date_usage":"12.34","generated_at":"2024-01-01T00:00:00Z"}
+            if parts == ["regions"]:
+                items = [{"slug":r,"name":r.upper(),"available":True,"sizes":list(state.sizes),"features":[]} for r in state.regions]
+                return 200,self.paged("regions",items,query)
+            if parts == ["sizes"]:
+                items = [{"slug":s,"memory":1024,"vcpus":1,"disk":25,"price_hourly":p,"price_monthly":p*730,"available":True,"regions":state.regions} for s,p in state.sizes.items()]
+                return 200,self.paged("sizes",items,query)
+            if parts == ["images"]:
+                return 200,self.paged("images",state.images,query)
+            if parts == ["account","keys"]:
+                return 200,self.paged("ssh_keys",state.keys,query)
+            if parts == ["projects"]:
+                return 200,self.paged("projects",state.projects,query)
+            if len(parts) == 3 and parts[0] == "projects" and parts[2] == "resources" and method == "POST":
+                items = [{"urn":u,"status":"ok"} for u in body.get("resources",[])]
+                return 200,{"resources":items}
+            if parts == ["domains"]:
+                items = [{"name":d,"ttl":1800,"zone_file":""} for d in state.domains]
+                return 200,self.paged("domains",items,query)
+            if len(parts) == 2 and parts[0] == "domains":
+                if parts[1] not in state.domains:
+                    return 404,{"id":"not_found","message":"domain not found"}
+                return 200,{"domain":{"name":parts[1],"ttl":1800,"zone_file":""}}
+            if len(parts) >= 3 and parts[0] == "domains" and parts[2] == "records":
+                domain = parts[1]
+                if domain not in state.domains:
+                    return 404,{"id":"not_found","message":"domain not found"}
+                if len(parts) == 3 and method == "GET":
+                    items = [dict((k,v) for k,v in r.items() if k != "domain") for r in state.records.values() if r['domain'] == domain]
+                    if "name" in query:
+                        full = query['name'][0]
+                        items = [r for r in items if r['name'] + "." + domain == full]
+                    return 200,self.paged("domain_records",items,query)
+                if len(parts) == 3 and method == "POST":
+                    record = state.add_record(domain,body.get("name"),body.get("data"),body.get("type","A"))
+                    return 201,{"domain_record":record}
+                record_id = int(parts[3])
+                if record_id not in state.records:
+                    return 404,{"id":"not_found","message":"record not found"}
+                if method == "PUT":
+                    state.records[record_id]['data'] = body.get("data",state.records[record_id]['data'])
+                    return 200,{"domain_record":state.records[record_id]}
+                if method == "DELETE":
+                    del(state.records[record_id])
+                    return 204,None
+            if parts == ["droplets"]:
+                if method == "GET":
+                    items = list(state.droplets.values())
+                    if "tag_name" in query:
+                        items = [d for d in items if query['tag_name'][0] in d['tags']]
+                    items = [state.droplet_json(d) for d in items]
+                    return 200,self.paged("droplets",items,query)
+                if method == "POST":
+                    if "names" in body:
+                        items = [state.droplet_json(state.new_droplet(n,body)) for n in body['names']]
+                        return 202,{"droplets":items,"links":{"actions":[{"id":state.new_id(),"rel":"create"}]}}
+                    droplet = state.droplet_json(state.new_droplet(body.get("name"),body))
+                    return 202,{"droplet":droplet,"links":{"actions":[{"id":state.new_id(),"rel":"create"}]}}
+                if method == "DELETE" and "tag_name" in query:
+                    tag = query['tag_name'][0]
+                    for droplet_id in [d['id'] for d in state.droplets.values() if tag in d['tags']]:
+                        del(state.droplets[droplet_id])
+                    return 204,None
+            if len(parts) == 2 and parts[0] == "droplets":
+                droplet_id = int(parts[1])
+                if droplet_id not in state.droplets:
+                    return 404,{"id":"not_found","message":"The resource you were accessing could not be found."}
+                if method == "GET":
+                    return 200,{"droplet":state.droplet_json(state.droplets[droplet_id])}
+                if method == "DELETE":
+                    del(state.droplets[droplet_id])
+                    return 204,None
+            if len(parts) == 2 and parts[0] == "tags":
+                return 200,{"tag":{"name":parts[1],"resources":{}}}
+            if parts == ["tags"] and method == "POST":
+                return 201,{"tag":{"name":body.get("name"),"resources":{}}}
+        return 404,{"id":"not_found","message":"fake api does not know " + method + " /" + "/".join(parts)}
+
+    def do_GET(self):
+        self.handle_any("GET")
+    def do_POST(self):
+        self.handle_any("POST")
+    def do_PUT(self):
+        self.handle_any("PUT")
+    def do_DELETE(self):
+        self.handle_any("DELETE")
+    def do_PATCH(self):
+        self.handle_any("PATCH")
+
+def start_server(opts):
+    '''start the fake API in a background thread, returns the server object'''
+    server = ThreadingHTTPServer((opts.host,opts.port),fake_handler)
+    server.daemon_threads = True
+    server.state = fake_state(opts)
+    thread = threading.Thread(target=server.serve_forever,daemon=True)
+    thread.start()
+    return server
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=prog_desc,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host"       ,help="address to listen on",default="127.0.0.1")
+    parser.add_argument("--port"       ,help="port to listen on, 0 picks a free one",type=int,default=8765)
+    parser.add_argument("--latency"    ,help="added latency per request, in milliseconds",type=float,default=0)
+    parser.add_argument("--ip-delay"   ,help="seconds before a new droplet gets an IP address",type=float,default=0)
+    parser.add_argument("--page-size"  ,help="max items per page, the real API caps at 200",type=int,default=200)
+    parser.add_argument("--rate-limit" ,help="requests allowed per window, 0 for unlimited",type=int,default=0)
+    parser.add_argument("--rate-window",help="length of the rolling rate limit window, in seconds",type=float,default=60)
+    parser.add_argument("--records"    ,help="filler A records pre-loaded in example.com",type=int,default=0)
+    parser.add_argument("--etag"       ,help="send ETags on GETs, and 304 for If-None-Match",action="store_true")
+    return parser
+
+def main():
+    opts   = get_parser().parse_args()
+    server = start_server(opts)
+    print("fake_do_api: listening on http://%s:%s/v2/" % server.server_address)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# exit codes 0-success, 1-operation error, 2-condition error, 3-regression
+prog_desc='''Benchmark harbor-wave against fake_do_api.py, a local stand-in for
+the Digital Ocean API. For each N, runs spawn N, list machines, check-config
+and destroy as a normal harbor-wave command, and reports wall time and API calls
+made. Nothing touches a real Digital Ocean account, and harbor-wave config and
+cache are kept in a throwaway home directory.
+
+Use --save to keep the results as JSON, and --baseline to compare a run against
+saved results. Any step that got more than --threshold percent slower, or made
+more API calls, is a regression and the exit code is 3.
+'''
+
+import os,sys,time
+import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+
+import fake_do_api
+
+bench_dir   = os.path.dirname(os.path.abspath(__file__))
+harbor_wave = os.path.join(bench_dir,"..","..","harbor_wave.py")
+base_name   = "bench"
+project     = "bench"
+# only the API key's format is checked. fake_do_api takes any key
+api_key     = "0" * 64
+
+class colors:
+    '''pretty terminal colors'''
+    reset='\033[0m'
+    bold='\033[01m'
+    red='\033[31m'
+    cyan='\033[36m'
+    green='\033[32m'
+    yellow='\033[93m'
+
+def exit_with_error(exit_code,message):
+    print("harborwave_bench:" + colors.red + colors.bold + " ERROR: " + colors.reset + message, file=sys.stderr)
+    sys.exit(exit_code)
+
+def warn(message):
+    print("harborwave_bench:" + colors.yellow + colors.bold + " ¡WARN!: " + colors.reset + message, file=sys.stderr)
+
+def message(message):
+    print("harborwave_bench: " + message)
+
+def api_get(server,path):
+    '''read /_stats or /_reset from the fake API, out of band'''
+    import urllib.request
+    url = "http://%s:%s%s" % (server.server_address[0],server.server_address[1],path)
+    with urllib.request.urlopen(url) as reply:
+        body = reply.read()
+    if body == b"":
+        return None
+    return json.loads(body.decode())
+
+def run_step(server,opts,env,name,n,arguments):
+    '''run one harbor-wave command, return a result dict'''
+    api_get(server,"/_reset")
+    command = [sys.executable,opts.harbor_wave,"-T","-a",api_key,"-n",base_name,"-p",project,"-t","1234","--parallel",str(opts.parallel)]
+    if opts.domain != "":
+        command += ["-d",opts.domain]
+    if opts.multi_create == True:
+        command.append("--multi-create")
+    command += arguments
+
+    start   = time.perf_counter()
+    process = subprocess.run(command,env=env,stdout=subprocess.PIPE,stderr=subprocess.PIPE,universal_newlines=True)
+    wall    = time.perf_counter() - start
+    stats   = api_get(server,"/_stats")
+
+    if process.returncode != 0:
+        warn(name + " " + str(n) + ": harbor-wave exited " + str(process.returncode) + ": " + process.stderr.strip())
+    return {
+        "step"     : name,
+        "n"        : n,
+        "wall"     : round(wall,3),
+        "calls"    : stats['total'],
+        "by_call"  : stats['calls'],
+        "exit"     : process.returncode,
+        "droplets" : stats['droplets'],
+    }
+
+def run_benchmark(opts):
+    '''start the fake API, run every step for every N, return list of results'''
+    server_opts = fake_do_api.get_parser().parse_args([
+        "--port","0",
+        "--latency",str(opts.latency),
+        "--page-size",str(opts.page_size),
+        "--rate-limit",str(opts.rate_limit),
+        "--rate-window",str(opts.rate_window),
+        "--records",str(opts.records),
+    ])
+    server = fake_do_api.start_server(server_opts)
+
+    home_dir = tempfile.mkdtemp(prefix="harborwave_bench.")
+    env = dict(os.environ)
+    env['HOME'] = home_dir
+    env.pop("XDG_CACHE_HOME",None)
+    env['DIGITALOCEAN_END_POINT'] = "http://%s:%s/v2/" % server.server_address
+
+    results = []
+    try:
+        for n in opts.sizes:
+            api_get(server,"/_reset?all=1")
+            results.append(run_step(server,opts,env,"spawn",n,["spawn",str(n)]))
+            results.append(run_step(server,opts,env,"list machines",n,["list","machines"]))
+            results.append(run_step(server,opts,env,"check-config",n,["-R","check-config"]))
+            results.append(run_step(server,opts,env,"check-config cached",n,["check-config"]))
+            results.append(run_step(server,opts,env,"destroy",n,["destroy"]))
+            if results[-1]['droplets'] != 0:
+                warn("destroy " + str(n) + ": " + str(results[-1]['droplets']) + " droplet(s) left over")
+    finally:
+        server.shutdown()
+        shutil.rmtree(home_dir,ignore_errors=True)
+    return results
+
+def print_results(results,baseline={}):
+    '''justified table, with the baseline numbers next to them if we have some'''
+    header = "STEP".ljust(20) + "N".rjust(6) + "SECONDS".rjust(10) + "API CALLS".rjust(11)
+    if baseline != {}:
+        header += "WAS SEC".rjust(10) + "WAS CALLS".rjust(11)
+    print(colors.bold + header + colors.reset)
+    for item in results:
+        out_line = item['step'].ljust(20) + str(item['n']).rjust(6) + ("%.3f" % item['wall']).rjust(10) + str(item['calls']).rjust(11)
+        key = item['step'] + ":" + str(item['n'])
+        if key in baseline:
+            out_line += ("%.3f" % baseline[key]['wall']).rjust(10) + str(baseline[key]['calls']).rjust(11)
+        print(out_line)
+
+def find_regressions(results,baseline,threshold):
+    '''return a list of warning lines, one per regressed step'''
+    out_list = []
+    for item in results:
+        key = item['step'] + ":" + str(item['n'])
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        # ignore noise on steps that are too fast to time well
+        if item['wall'] > old['wall'] * (1 + threshold / 100) and item['wall'] - old['wall'] > 0.1:
+            out_list.append(key + " took " + ("%.3f" % item['wall']) + "s, was " + ("%.3f" % old['wall']) + "s")
+        if item['calls'] > old['calls']:
+            out_list.append(key + " made " + str(item['calls']) + " API calls, was " + str(old['calls']))
+    return out_list
+
+def load_baseline(file_name):
+    try:
+        file_obj = open(file_name,"r")
+        contents = json.loads(file_obj.read())
+        file_obj.close()
+    except (OSError,ValueError) as e:
+        exit_with_error(2,"Could not read baseline " + file_name + ": " + str(e))
+    out_dict = {}
+    for item in contents['results']:
+        out_dict[item['step'] + ":" + str(item['n'])] = item
+    return out_dict
+
+def main():
+    parser = argparse.ArgumentParser(description=prog_desc,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-N","--sizes"      ,help="comma separated list of droplet counts. Default: 1,10,100,500",type=str,default="1,10,100,500")
+    parser.add_argument("--latency"         ,help="added latency per API request, in milliseconds. Default: 50",type=float,default=50)
+    parser.add_argument("--page-size"       ,help="max items per page from the API. Default: 200",type=int,default=200)
+    parser.add_argument("--rate-limit"      ,help="API requests allowed per window, 0 for unlimited. Default: 0",type=int,default=0)
+    parser.add_argument("--rate-window"     ,help="length of the rate limit window, in seconds. Default: 60",type=float,default=60)
+    parser.add_argument("--records"         ,help="filler DNS records in the domain. Default: 500",type=int,default=500)
+    parser.add_argument("-d","--domain"     ,help="domain to use for DNS, blank to skip DNS. Default: example.com",type=str,default="example.com")
+    parser.add_argument("--parallel"        ,help="harbor-wave parallel setting. Default: 10",type=int,default=10)
+    parser.add_argument("--multi-create"    ,help="run spawn with --multi-create",action="store_true")
+    parser.add_argument("--harbor-wave"     ,help="harbor_wave.py to benchmark. Default: the one in this tree",type=str,default=harbor_wave)
+    parser.add_argument("-s","--save"       ,help="save results to this JSON file",type=str)
+    parser.add_argument("-b","--baseline"   ,help="compare results with this JSON file from --save",type=str)
+    parser.add_argument("--threshold"       ,help="percent slower before a step counts as a regression. Default: 20",type=float,default=20)
+    opts = parser.parse_args()
+
+    try:
+        opts.sizes = [int(n) for n in opts.sizes.split(",")]
+    except ValueError:
+        exit_with_error(2,"--sizes must be a comma separated list of intergers")
+    if os.path.isfile(opts.harbor_wave) == False:
+        exit_with_error(2,opts.harbor_wave + " not found")
+
+    baseline = {}
+    if opts.baseline != None:
+        baseline = load_baseline(opts.baseline)
+
+    message("latency " + str(opts.latency) + "ms, N=" + ",".join(str(n) for n in opts.sizes))
+    results = run_benchmark(opts)
+    print_results(results,baseline)
+
+    if opts.save != None:
+        settings = dict(vars(opts))
+        del(settings['save'])
+        del(settings['baseline'])
+        file_obj = open(opts.save,"w")
+        file_obj.write(json.dumps({"settings":settings,"results":results},indent=4))
+        file_obj.close()
+        message("saved results to " + opts.save)
+
+    exit_code = 0
+    for item in results:
+        if item['exit'] != 0:
+            exit_code = 1
+    for line in find_regressions(results,baseline,opts.threshold):
+        warn("regression: " + line)
+        exit_code = 3
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
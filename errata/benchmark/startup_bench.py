@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# exit codes 0-success, 1-operation error, 2-condition error
+prog_desc='''Time how long harbor-wave takes to start and finish commands that
+don't use the API: get, set, print-config, help and touch. These get called in
+shell loops, so start up time is most of what they cost. Each command is run
+--runs times, and the median is reported, next to bare python start up time.
+
+Use --compare with another copy of harbor_wave.py to see both side by side,
+for instance, one from an older commit:
+
+git show HEAD~1:harbor_wave.py > /tmp/old_harbor_wave.py
+'''
+
+import os,sys,time
+import argparse
+import shutil
+import statistics
+import subprocess
+import tempfile
+
+bench_dir   = os.path.dirname(os.path.abspath(__file__))
+harbor_wave = os.path.join(bench_dir,"..","..","harbor_wave.py")
+
+offline_commands = [
+    ("get base-name"     , ["get","base-name"]),
+    ("set base-name"     , ["set","base-name","bench"]),
+    ("print-config"      , ["print-config","-T"]),
+    ("help commands"     , ["help","commands"]),
+    ("touch"             , ["touch"]),
+]
+
+def exit_with_error(exit_code,message):
+    print("startup_bench: ERROR: " + message, file=sys.stderr)
+    sys.exit(exit_code)
+
+def time_command(command,env,runs):
+    '''run command runs times, return median wall time in milliseconds'''
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command,env=env,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=prog_desc,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r","--runs"       ,help="times to run each command. Default: 20",type=int,default=20)
+    parser.add_argument("--harbor-wave"     ,help="harbor_wave.py to time. Default: the one in this tree",type=str,default=harbor_wave)
+    parser.add_argument("-c","--compare"    ,help="another harbor_wave.py to time next to it",type=str)
+    opts = parser.parse_args()
+
+    scripts = [opts.harbor_wave]
+    if opts.compare != None:
+        scripts.append(opts.compare)
+    for script in scripts:
+        if os.path.isfile(script) == False:
+            exit_with_error(2,script + " not found")
+
+    # config goes in a throwaway home directory
+    home_dir = tempfile.mkdtemp(prefix="harborwave_startup.")
+    env = dict(os.environ)
+    env['HOME'] = home_dir
+
+    try:
+        floor = time_command([sys.executable,"-c","pass"],env,opts.runs)
+        header = "COMMAND".ljust(20) + "THIS ms".rjust(10)
+        if opts.compare != None:
+            header += "COMPARE ms".rjust(12) + "SPEEDUP".rjust(10)
+        print(header)
+        print("python -c pass".ljust(20) + ("%.1f" % floor).rjust(10))
+        for name,arguments in offline_commands:
+            results = []
+            for script in scripts:
+                results.append(time_command([sys.executable,script] + arguments,env,opts.runs))
+            out_line = name.ljust(20) + ("%.1f" % results[0]).rjust(10)
+            if opts.compare != None:
+                out_line += ("%.1f" % results[1]).rjust(12) + ("%.1fx" % (results[1] / results[0])).rjust(10)
+            print(out_line)
+    finally:
+        shutil.rmtree(home_dir,ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
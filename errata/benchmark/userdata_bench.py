@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# exit codes 0-success, 1-operation error, 2-condition error
+prog_desc='''Micro-benchmark for the part of spawn that makes user-data. Compares
+the old way, a full dict with the payload for every droplet, run through
+json.dumps(indent=2) and kept until the creates go out, with
+harbor_wave.user_data_template, which turns the payload into JSON once and
+splices in the per droplet fields as each create goes out.
+
+For each payload size and N, prints CPU time, peak memory(tracemalloc), and
+user-data bytes per droplet. Nothing talks to the network.
+'''
+
+import os,sys,time
+import argparse
+import importlib.util
+import json
+import tracemalloc
+
+bench_dir   = os.path.dirname(os.path.abspath(__file__))
+harbor_wave = os.path.join(bench_dir,"..","..","harbor_wave.py")
+
+def exit_with_error(exit_code,message):
+    print("userdata_bench: ERROR: " + message, file=sys.stderr)
+    sys.exit(exit_code)
+
+def load_harbor_wave(file_name):
+    '''import harbor_wave.py as a module, main() is not run'''
+    spec   = importlib.util.spec_from_file_location("harbor_wave",file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def make_payload(size):
+    '''text payload of size bytes, with newlines and quotes to escape'''
+    line = 'key = "value", other = "more"\n'
+    return (line * (size // len(line) + 1))[:size]
+
+def per_droplet(payload,N,parallel):
+    '''the old spawn loop. Every droplet's user-data is made up front'''
+    create_jobs = []
+    for i in range(N):
+        user_meta = {
+        "sequence" : i,
+        "total_vms": N,
+        "base-name":"bench",
+        "domain":"",
+        "region":"nyc1",
+        "expires":None,
+        "payload":payload,
+        "payload-filename":"",
+        "payload-encoding":"none",
+        "payload-shard":"none",
+        }
+        create_jobs.append(json.dumps(user_meta,indent=2))
+    largest = 0
+    for user_meta in create_jobs:
+        largest = max(largest,len(user_meta.encode()))
+    return largest
+
+def template(module,payload,N,parallel):
+    '''the spawn loop now. Jobs hold only per droplet fields, and user-data
+    is made as each create goes out, parallel at a time'''
+    common_meta = {
+    "total_vms": N,
+    "base-name":"bench",
+    "domain":"",
+    "expires":None,
+    "payload-filename":"",
+    "payload-encoding":"none",
+    "payload-shard":"none",
+    "payload":payload,
+    }
+    meta_template = module.user_data_template(common_meta)
+    create_jobs = []
+    for i in range(N):
+        create_jobs.append( {"sequence":i,"region":"nyc1"} )
+    largest = 0
+    for machine_meta in create_jobs:
+        largest = max(largest,meta_template.size(machine_meta))
+    in_flight = []
+    for machine_meta in create_jobs:
+        in_flight.append(meta_template.render(machine_meta))
+        if len(in_flight) >= parallel:
+            in_flight = []
+    return largest
+
+def measure(function,*args):
+    '''run function, return CPU seconds, peak bytes allocated, and its result'''
+    tracemalloc.start()
+    start  = time.process_time()
+    result = function(*args)
+    cpu    = time.process_time() - start
+    peak   = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu,peak,result
+
+def main():
+    parser = argparse.ArgumentParser(description=prog_desc,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-N","--sizes"      ,help="comma separated list of droplet counts. Default: 10,100,500",type=str,default="10,100,500")
+    parser.add_argument("-p","--payloads"   ,help="comma separated list of payload sizes in KiB. Default: 1,16,60",type=str,default="1,16,60")
+    parser.add_argument("--parallel"        ,help="creates in flight at once. Default: 10",type=int,default=10)
+    parser.add_argument("--harbor-wave"     ,help="harbor_wave.py to benchmark. Default: the one in this tree",type=str,default=harbor_wave)
+    opts = parser.parse_args()
+
+    try:
+        sizes    = [int(n) for n in opts.sizes.split(",")]
+        payloads = [int(n) for n in opts.payloads.split(",")]
+    except ValueError:
+        exit_with_error(2,"--sizes and --payloads must be comma separated lists of intergers")
+    if os.path.isfile(opts.harbor_wave) == False:
+        exit_with_error(2,opts.harbor_wave + " not found")
+    module = load_harbor_wave(opts.harbor_wave)
+    if hasattr(module,"user_data_template") == False:
+        exit_with_error(2,opts.harbor_wave + " has no user_data_template")
+
+    header = "PAYLOAD KiB".rjust(11) + "N".rjust(6) + "OLD ms".rjust(10) + "NEW ms".rjust(10) + "OLD PEAK KiB".rjust(14) + "NEW PEAK KiB".rjust(14) + "OLD BYTES".rjust(11) + "NEW BYTES".rjust(11)
+    print(header)
+    for kib in payloads:
+        payload = make_payload(kib * 1024)
+        for N in sizes:
+            old_cpu,old_peak,old_bytes = measure(per_droplet,payload,N,opts.parallel)
+            new_cpu,new_peak,new_bytes = measure(template,module,payload,N,opts.parallel)
+            out_line  = str(kib).rjust(11) + str(N).rjust(6)
+            out_line += ("%.1f" % (old_cpu * 1000)).rjust(10) + ("%.1f" % (new_cpu * 1000)).rjust(10)
+            out_line += str(old_peak // 1024).rjust(14) + str(new_peak // 1024).rjust(14)
+            out_line += str(old_bytes).rjust(11) + str(new_bytes).rjust(11)
+            print(out_line)
+
+if __name__ == "__main__":
+    main()
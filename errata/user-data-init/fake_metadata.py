@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# exit codes 0-success, 1-operation error, 2-condition error
+prog_desc='''Local stand-in for Digital Ocean's droplet metadata service, to test
+harborwave_init_meta.py off of a droplet. Serves /metadata/v1.json, and the
+/metadata/v1/user-data and /metadata/v1/hostname paths, with user-data read
+from a file. It can act like a metadata service that is not up yet at boot.
+
+run it, then point the init script at it:
+./fake_metadata.py --user-data user-data.json --port 8769 --not-ready 3
+./harborwave_init_meta.py --host 127.0.0.1:8769 --app-dir /tmp/hw --env-file /tmp/hw/environment --logfile /tmp/hw/init.log
+'''
+
+import sys,time
+import argparse
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class metadata_handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self,*args):
+        return
+
+    def reply(self,code,body=b"",content_type="application/json"):
+        self.send_response(code)
+        self.send_header("Content-Type",content_type)
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            request_n = server.requests
+        # not up yet. Drop the connection or send a 503, like a metadata
+        # service still starting
+        if time.monotonic() - server.started < server.opts.not_ready or request_n <= server.opts.fail:
+            if server.opts.drop == True:
+                self.close_connection = True
+                return
+            return self.reply(503,b'{"message":"not ready"}')
+        metadata = {
+            "droplet_id"  : server.opts.droplet_id,
+            "hostname"    : server.opts.hostname,
+            "user_data"   : server.user_data,
+            "vendor_data" : "",
+            "public_keys" : [],
+            "region"      : server.opts.region,
+            "tags"        : ["harborwave"],
+        }
+        path = self.path.rstrip("/")
+        if path == "/metadata/v1.json":
+            return self.reply(200,json.dumps(metadata).encode())
+        if path == "/metadata/v1/user-data":
+            return self.reply(200,server.user_data.encode(),"text/plain")
+        if path == "/metadata/v1/hostname":
+            return self.reply(200,server.opts.hostname.encode(),"text/plain")
+        return self.reply(404,b'{"message":"not found"}')
+
+def start_server(opts):
+    '''start in a thread, returns the server. port 0 picks a free one'''
+    server = ThreadingHTTPServer((opts.host,opts.port),metadata_handler)
+    server.daemon_threads = True
+    server.opts     = opts
+    server.lock     = threading.Lock()
+    server.requests = 0
+    server.started  = time.monotonic()
+    file_obj = open(opts.user_data,"r")
+    server.user_data = file_obj.read()
+    file_obj.close()
+    thread = threading.Thread(target=server.serve_forever,daemon=True)
+    thread.start()
+    return server
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=prog_desc,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-u","--user-data" ,help="file with the droplet's user-data, i.e. from harbor-wave",type=str,required=True)
+    parser.add_argument("--host"           ,help="address to listen on",default="127.0.0.1")
+    parser.add_argument("--port"           ,help="port to listen on, 0 picks a free one",type=int,default=8769)
+    parser.add_argument("--hostname"       ,help="droplet hostname. Default: bench0",default="bench0")
+    parser.add_argument("--region"         ,help="droplet region. Default: nyc1",default="nyc1")
+    parser.add_argument("--droplet-id"     ,help="droplet id. Default: 1000",type=int,default=1000)
+    parser.add_argument("--not-ready"      ,help="seconds after start before it answers",type=float,default=0)
+    parser.add_argument("--fail"           ,help="fail this many requests first",type=int,default=0)
+    parser.add_argument("--drop"           ,help="while not ready, drop connections instead of a 503",action="store_true")
+    return parser
+
+def main():
+    opts = get_parser().parse_args()
+    try:
+        server = start_server(opts)
+    except OSError as e:
+        print("fake_metadata: ERROR: " + str(e), file=sys.stderr)
+        sys.exit(1)
+    print("fake_metadata: listening on http://%s:%s/metadata/v1.json" % server.server_address)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
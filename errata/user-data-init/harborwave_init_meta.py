@@ -5,17 +5,29 @@ Download initialize harbor-wave data from Digital Ocean's API, so its available
 for the system
 '''
 
-import sys,os
+import sys,os,time
+import random
+import argparse
 import json
+import base64,zlib
+import tarfile
+import tempfile
+import shutil
 import urllib.request
+import urllib.error
 from http.client import responses as http_responses
 from datetime import datetime
 
 config = {
     'host'        : '169.254.169.254',
-    'path'        : '/metadata/v1/user-data',
-    'timeout'     : 3, # timeout, in seconds, for URL query
+    # everything, user-data and hostname included, in one request
+    'path'        : '/metadata/v1.json',
+    'timeout'     : 3, # timeout, in seconds, for each URL query
+    'deadline'    : 120, # keep trying the metadata service this long, seconds
+    'retry-min'   : 0.1, # first wait between tries, doubles up to retry-max
+    'retry-max'   : 2,
     'logfile'     : "/var/log/harbor-wave-init.log",
+    'env-file'    : '/etc/environment',
     'app-dir'     : '/opt/harborwave',
     'done-file'   : '/opt/harborwave/done',
     'needed-keys' : ['sequence', 'base-name', 'payload', 'payload-filename','domain','total_vms'],
@@ -36,7 +48,7 @@ def submsg(message):
     print_message = "[+]\t" + message
     print(print_message)
     do_log(print_message)
-        
+
 def warn(message):
     print_message="harborwave_initlization: ¡WARN!: " + message
     print(print_message, file=sys.stderr)
@@ -46,86 +58,267 @@ def do_log(message):
     time_obj   = datetime.now()
     time_stamp = time_obj.ctime()
     out_message = time_stamp + "\t" + message + "\n"
-    log_obj = open(config['logfile'],'a')
-    log_obj.write(out_message)
-    log_obj.close()
-
-def get_data(config):
-    '''get the data and return it as a dict, takes the config array'''
-    get_url     = "http://" + config['host'] + config['path']
-    
-    # do URL call, and check for errors, both in fetching and any codes from
-    # the server
     try:
-        response = urllib.request.urlopen(get_url,timeout=config['timeout'])
-    except:
-        exit_with_error(1,"Could not retrieve data from API!")
+        log_obj = open(config['logfile'],'a')
+        log_obj.write(out_message)
+        log_obj.close()
+    except OSError:
+        pass
+
+def atomic_write(file_name,chunks,mode=0o644):
+    '''write chunks, an iterable of bytes, to a temp file next to file_name,
+    then rename it over file_name. Readers see the old file or the new one,
+    never half of one, even if we die part way'''
+    file_dir = os.path.dirname(file_name) or "."
+    file_obj = tempfile.NamedTemporaryFile(dir=file_dir,prefix="." + os.path.basename(file_name) + ".",delete=False)
+    try:
+        for chunk in chunks:
+            file_obj.write(chunk)
+        file_obj.flush()
+        os.fsync(file_obj.fileno())
+        file_obj.close()
+        os.chmod(file_obj.name,mode)
+        os.replace(file_obj.name,file_name)
+    except Exception:
+        file_obj.close()
+        os.unlink(file_obj.name)
+        raise
+
+def fetch_url(url,timeout):
+    '''one GET, returns the body as bytes. Raises on anything but a 200'''
+    response = urllib.request.urlopen(url,timeout=timeout)
     if response.code != 200:
-        exit_with_error(1,"HTTP Error " + response.code + ": " + http_responses[response.code])
-    
-    # now, get a python dict from the response
-    raw_data    = response.read()
-    output_data = raw_data.decode()
+        raise urllib.error.HTTPError(url,response.code,http_responses.get(response.code,""),response.headers,None)
+    return response.read()
+
+def get_metadata(config):
+    '''get droplet metadata from /metadata/v1.json as a dict. At boot, the
+    metadata service might not answer yet, so keep trying, with short waits
+    that double, until config['deadline']. returns metadata and tries made'''
+    get_url  = "http://" + config['host'] + config['path']
+    start    = time.monotonic()
+    wait     = config['retry-min']
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            metadata = json.loads(fetch_url(get_url,config['timeout']).decode())
+            return metadata,attempts
+        except urllib.error.HTTPError as e:
+            last_error = "HTTP Error " + str(e.code) + ": " + http_responses.get(e.code,"")
+        except ValueError:
+            last_error = "metadata isn't JSON"
+        except (urllib.error.URLError,OSError) as e:
+            last_error = str(e)
+        elapsed = time.monotonic() - start
+        if elapsed + wait > config['deadline']:
+            exit_with_error(1,"Could not retrieve data from API after " + str(attempts) + " tries in " + ("%.1f" % elapsed) + "s: " + last_error)
+        time.sleep(random.uniform(wait / 2,wait))
+        wait = min(wait * 2,config['retry-max'])
+
+def get_data(metadata):
+    '''harbor-wave's data from the user_data in metadata, as a dict'''
     try:
-        output_data = json.loads(output_data)
-    except:
+        output_data = json.loads(metadata.get('user_data') or "")
+    except ValueError:
         exit_with_error(9,"Data isn't in the JSON format, are you sure this is a harbor-wave VM?")
-    
+    if type(output_data) != dict:
+        exit_with_error(9,"Data isn't a JSON object, are you sure this is a harbor-wave VM?")
+
     # check to make sure all fields are there
     data_keys = output_data.keys()
     missing_keys = []
     for item in config['needed-keys']:
         if item not in data_keys:
-            missing_keys.appennd(item)
+            missing_keys.append(item)
     if missing_keys != []:
         missing_keys = ",".join(missing_keys)
-        exit_with_error(9,"Missing JSON items" + missing keys + ": are you sure this is a harbor-wave VM?")
-    
+        exit_with_error(9,"Missing JSON items " + missing_keys + ": are you sure this is a harbor-wave VM?")
+
     return output_data
 
+def resolve_sequence(data,hostname):
+    '''Machines made with multi-create share user-data, so sequence is null.
+    Look up our own sequence number in sequence-map by hostname, falling back
+    to the number after base-name in the hostname. updates data'''
+    if data['sequence'] != None:
+        return data
+
+    short_name   = hostname.split(".")[0]
+    sequence_map = data.get('sequence-map',{})
+    for name in sequence_map:
+        if name == hostname or name.split(".")[0] == short_name:
+            data['sequence'] = sequence_map[name]
+            return data
+
+    # not in the map, derive it from the hostname
+    try:
+        data['sequence'] = int(short_name[len(data['base-name']):])
+    except:
+        exit_with_error(9,"Could not work out sequence number for " + hostname)
+    return data
+
 def write_environment(data):
-    '''Add sequence and base-name to /etc/environment.'''
-    env_file = '/etc/environment'
+    '''Add sequence and base-name to /etc/environment. Lines from an earlier
+    run are replaced, not added to'''
+    env_file = config['env-file']
     out_lines  = "HARBORWAVE_SEQEUNCE="  + str(data['sequence']) + "\n"
     out_lines += "HARBORWAVE_TOTAL_VMS=" + str(data['total_vms']) + "\n"
     out_lines += "HARBORWAVE_BASENAME="  + data['base-name'] + "\n"
     out_lines += "HARBORWAVE_DOMAIN="    + data['domain'] + "\n"
+    if 'region' in data:
+        out_lines += "HARBORWAVE_REGION="    + data['region'] + "\n"
     try:
-        file_obj = open(env_file,'a')
-        file_obj.write(out_lines)
-        file_obj.close()
+        old_lines = []
+        if os.path.exists(env_file) == True:
+            file_obj = open(env_file,'r')
+            old_lines = file_obj.readlines()
+            file_obj.close()
+        keep_lines = ""
+        for line in old_lines:
+            if line.startswith("HARBORWAVE_") == False:
+                keep_lines += line
+        if keep_lines != "" and keep_lines.endswith("\n") == False:
+            keep_lines += "\n"
+        atomic_write(env_file,[(keep_lines + out_lines).encode()])
     except:
         warn("Could not write to " + env_file)
         return 1
-        
+
     return 0
 
+def payload_chunks(data,chunk_size=65536):
+    '''yield the payload as bytes, a piece at a time, undoing
+    payload-encoding. A gzipped payload is unzipped as it is written, so
+    the whole thing is never in memory. Older harbor-wave does not send
+    payload-encoding, that is the same as none. Raises ValueError if the
+    payload can't be decoded'''
+    encoding = data.get('payload-encoding','none')
+    if encoding == "none":
+        payload = data['payload'].encode()
+        for i in range(0,len(payload),chunk_size):
+            yield payload[i:i + chunk_size]
+        return
+    if encoding not in ("gzip+base64","tar+gzip+base64"):
+        raise ValueError("Unknown payload-encoding " + encoding + ", update this script")
+    try:
+        payload = base64.b64decode(data['payload'],validate=True)
+    except ValueError:
+        raise ValueError("Could not decode " + encoding + " payload")
+    if encoding == "tar+gzip+base64":
+        # a tar.gz of files, write_payload unpacks it
+        yield payload
+        return
+    # wbits 31, gzip header
+    unzip = zlib.decompressobj(31)
+    try:
+        for i in range(0,len(payload),chunk_size):
+            yield unzip.decompress(payload[i:i + chunk_size])
+        yield unzip.flush()
+    except zlib.error:
+        raise ValueError("Could not unzip " + encoding + " payload")
+    if unzip.eof == False:
+        raise ValueError("Could not unzip " + encoding + " payload, it is cut short")
+
+def decode_payload(data):
+    '''payload as bytes, undoing payload-encoding'''
+    return b"".join(payload_chunks(data))
+
+def unpack_payload(data,payload_dir):
+    '''unpack a files shard into payload_dir. Unpacks to a temp directory
+    first, then renames each item into place'''
+    tar_file = tempfile.TemporaryFile()
+    for chunk in payload_chunks(data):
+        tar_file.write(chunk)
+    tar_file.seek(0)
+    temp_dir = tempfile.mkdtemp(dir=config['app-dir'],prefix=".payload.")
+    try:
+        tar_obj = tarfile.open(fileobj=tar_file,mode="r:gz")
+        # don't let paths in the archive out of payload_dir
+        if hasattr(tarfile,"data_filter"):
+            tar_obj.extractall(temp_dir,filter="data")
+        else:
+            # older python, no extraction filters. Only plain files and
+            # directories, so no links to write through, and every path has
+            # to land inside temp_dir
+            real_dir = os.path.realpath(temp_dir)
+            for member in tar_obj.getmembers():
+                if member.isfile() == False and member.isdir() == False:
+                    raise ValueError("links and special files not allowed in payload: " + member.name)
+                target = os.path.realpath(os.path.join(real_dir,member.name))
+                if member.name.startswith("/") or ".." in member.name.split("/") or target.startswith(real_dir + os.sep) == False:
+                    raise ValueError("unsafe path in payload: " + member.name)
+            tar_obj.extractall(temp_dir)
+        tar_obj.close()
+        for item in os.listdir(temp_dir):
+            target = os.path.join(payload_dir,item)
+            if os.path.isdir(target) == True and os.path.islink(target) == False:
+                shutil.rmtree(target)
+            os.replace(os.path.join(temp_dir,item),target)
+    finally:
+        tar_file.close()
+        shutil.rmtree(temp_dir,ignore_errors=True)
+
 def write_payload(data):
-    '''write payload file'''
-    
+    '''write payload file. With payload-shard, this is only this machine's
+    part of it. A shard of files is unpacked into the payload directory.
+
+    A payload that can't be decoded or unpacked exits with 9, before the
+    donefile is written, so the script runs again next boot, i.e. after it
+    is updated for a new payload-encoding. Trouble writing it is a warning'''
+
     payload_dir = config['app-dir'] + "/payload"
     os.makedirs(payload_dir,mode=0o755,exist_ok=True)
+    if data.get('payload-encoding') == "tar+gzip+base64":
+        try:
+            unpack_payload(data,payload_dir)
+        except (ValueError,EOFError,tarfile.TarError) as e:
+            exit_with_error(9,"Could not unpack payload: " + str(e))
+        except Exception:
+            warn("Could not unpack payload to " + payload_dir)
+            return 1
+        return 0
     if data['payload-filename'] != "":
         payload_file = payload_dir + "/" + data['payload-filename']
     else:
         payload_file = payload_dir + "/data"
     try:
-        file_obj = open(payload_file,"w")
-        file_obj.write(data['payload'])
-        file_obj.close()
-    except:
+        atomic_write(payload_file,payload_chunks(data))
+    except ValueError as e:
+        exit_with_error(9,str(e))
+    except Exception:
         warn("Could not write payload to " + payload_file)
         return 1
-    
+
+    return 0
+
+def write_collect(data):
+    '''If spawn was given a collect-url, save where and how to send results
+    to collect.json, for harborwave_report.py. Has the token, so only root
+    can read it'''
+    if data.get('collect-url',"") == "":
+        return 0
+    collect_file = config['app-dir'] + "/collect.json"
+    collect_info = {
+        "url"       : data['collect-url'],
+        "token"     : data['collect-token'],
+        "base-name" : data['base-name'],
+        "sequence"  : data['sequence'],
+        "total_vms" : data['total_vms'],
+    }
+    try:
+        atomic_write(collect_file,[json.dumps(collect_info).encode()],0o600)
+    except:
+        warn("Could not write " + collect_file + ", results can't be sent back")
+        return 1
+
     return 0
 
 def write_done():
     '''Touch /opt/harbor-wave/done so we know this script ran already'''
     done_file = config['done-file']
     try:
-        file_obj = open(done_file,"w")
-        file_obj.write("\n")
-        file_obj.close()
+        atomic_write(done_file,[b"\n"])
     except:
         warn("Could not write donefile, the script will repeat!")
         return 1
@@ -133,33 +326,62 @@ def write_done():
     return 0
 
 def main():
+    parser = argparse.ArgumentParser(description=prog_desc,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host"      ,help="metadata service address, host or host:port. Default: " + config['host'],type=str)
+    parser.add_argument("--deadline"  ,help="seconds to keep trying the metadata service. Default: " + str(config['deadline']),type=float)
+    parser.add_argument("--app-dir"   ,help="where payload and donefile go. Default: " + config['app-dir'],type=str)
+    parser.add_argument("--env-file"  ,help="environment file to add HARBORWAVE_ variables to. Default: " + config['env-file'],type=str)
+    parser.add_argument("--logfile"   ,help="Default: " + config['logfile'],type=str)
+    args = parser.parse_args()
+    if args.host != None:
+        config['host']      = args.host
+    if args.deadline != None:
+        config['deadline']  = args.deadline
+    if args.app_dir != None:
+        config['app-dir']   = args.app_dir
+        config['done-file'] = args.app_dir + "/done"
+    if args.env_file != None:
+        config['env-file']  = args.env_file
+    if args.logfile != None:
+        config['logfile']   = args.logfile
+
+    start = time.monotonic()
     message("Getting and parsing Harbor-Wave data from Digital Ocean API")
     WARNS = 0
     # Check if this script ran already
     if os.path.exists(config['done-file']) == True:
         warn("Script ran already, doing nothing and exiting")
         sys.exit(0)
-    
+
     # ensure directory is available
     os.makedirs(config['app-dir'],mode=0o755,exist_ok=True)
-    
+
     submsg("Retrieving Data")
-    data = get_data(config)
-    
+    metadata,attempts = get_metadata(config)
+    fetch_time = time.monotonic() - start
+    submsg("Got metadata in " + ("%.2f" % fetch_time) + "s, " + str(attempts) + " tries")
+    data = get_data(metadata)
+    data = resolve_sequence(data,metadata.get('hostname',""))
+
     submsg("Writing to environment file")
     WARNS += write_environment(data)
-    
+
     submsg("Extracting payload")
+    payload_start = time.monotonic()
     WARNS += write_payload(data)
-    
+    payload_time = time.monotonic() - payload_start
+
+    WARNS += write_collect(data)
+
     submsg("Writing donefile")
     WARNS += write_done()
-    
+
+    timing = "%.2fs, metadata %.2fs, payload %.2fs" % (time.monotonic() - start,fetch_time,payload_time)
     if WARNS > 0:
-        message("Done, but with " + WARNS + " warning(s)")
+        message("Done in " + timing + ", but with " + str(WARNS) + " warning(s)")
         sys.exit(1)
     else:
-        message("Done")
+        message("Done in " + timing)
 
 if __name__ == "__main__":
     main()
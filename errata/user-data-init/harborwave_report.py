@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# exit codes 0-success, 1-operation error, 2-condition error
+prog_desc='''
+Send this droplet's result back to harbor-wave collect on the computer that
+spawned it. Uses collect.json, written by harborwave_init_meta.py when spawn
+had a collect-url. Run it when your job is done, with its exit code and a
+result file, or - for stdin:
+
+./my_job > /tmp/result.txt ; /root/harborwave_report.py --exit $? /tmp/result.txt
+
+The file is sent as it is read, so big results don't need to fit in memory.
+If collect is not up or the network drops, it keeps trying for --deadline
+seconds.
+'''
+
+import sys,os,time
+import random
+import argparse
+import json
+import shutil
+import tempfile
+import http.client
+import urllib.parse
+from datetime import datetime
+
+config = {
+    'collect-file' : '/opt/harborwave/collect.json',
+    'timeout'      : 30, # socket timeout, in seconds
+    'deadline'     : 600, # keep trying this long, seconds
+    'retry-min'    : 1, # first wait between tries, doubles up to retry-max
+    'retry-max'    : 30,
+    'chunk-size'   : 65536,
+    'logfile'      : "/var/log/harbor-wave-init.log",
+}
+
+def message(message):
+    print_message = "harborwave_report: " + message
+    print(print_message)
+    do_log(print_message)
+
+def exit_with_error(error,message):
+    print_message = "harborwave_report ¡ERROR!: " + message
+    print(print_message, file=sys.stderr)
+    do_log(print_message)
+    sys.exit(error)
+
+def warn(message):
+    print_message="harborwave_report: ¡WARN!: " + message
+    print(print_message, file=sys.stderr)
+    do_log(print_message)
+
+def do_log(message):
+    time_obj   = datetime.now()
+    time_stamp = time_obj.ctime()
+    out_message = time_stamp + "\t" + message + "\n"
+    try:
+        log_obj = open(config['logfile'],'a')
+        log_obj.write(out_message)
+        log_obj.close()
+    except OSError:
+        pass
+
+def load_collect_info(file_name):
+    '''read collect.json, exit if this droplet has nowhere to report to'''
+    try:
+        file_obj = open(file_name,"r")
+        collect_info = json.load(file_obj)
+        file_obj.close()
+    except FileNotFoundError:
+        exit_with_error(2,file_name + " not found, spawn was not given a collect-url")
+    except (OSError,ValueError) as e:
+        exit_with_error(1,"Could not read " + file_name + ": " + str(e))
+    return collect_info
+
+def send_result(collect_info,file_obj,size,exit_code):
+    '''one try at POSTing the result, returns the HTTP status'''
+    url_parts = urllib.parse.urlsplit(collect_info['url'])
+    path  = url_parts.path.rstrip("/") + "/result/" + urllib.parse.quote(collect_info['base-name']) + "/" + str(collect_info['sequence'])
+    path += "?exit=" + str(exit_code)
+    headers = {
+        "Authorization"          : "Bearer " + collect_info['token'],
+        "Content-Length"         : str(size),
+        "Content-Type"           : "application/octet-stream",
+        "X-Harborwave-Total-Vms" : str(collect_info['total_vms']),
+        "X-Harborwave-Hostname"  : os.uname().nodename,
+    }
+    connection = http.client.HTTPConnection(url_parts.hostname,url_parts.port or 80,timeout=config['timeout'])
+    try:
+        connection.putrequest("POST",path)
+        for name in headers:
+            connection.putheader(name,headers[name])
+        connection.endheaders()
+        file_obj.seek(0)
+        while True:
+            chunk = file_obj.read(config['chunk-size'])
+            if chunk == b"":
+                break
+            connection.send(chunk)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=prog_desc,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("result"          ,help="file to send, - for stdin. Default: nothing, only the exit code",nargs="?",type=str)
+    parser.add_argument("-e","--exit"     ,help="exit code of your job. Default: 0",type=int,default=0)
+    parser.add_argument("--collect-file"  ,help="Default: " + config['collect-file'],type=str)
+    parser.add_argument("--deadline"      ,help="seconds to keep trying. Default: " + str(config['deadline']),type=float)
+    parser.add_argument("--logfile"       ,help="Default: " + config['logfile'],type=str)
+    args = parser.parse_args()
+    if args.collect_file != None:
+        config['collect-file'] = args.collect_file
+    if args.deadline != None:
+        config['deadline']     = args.deadline
+    if args.logfile != None:
+        config['logfile']      = args.logfile
+
+    collect_info = load_collect_info(config['collect-file'])
+
+    # stdin is spooled to a temp file, so we know the size, and can send it
+    # again if the first try fails
+    if args.result == "-":
+        file_obj = tempfile.TemporaryFile()
+        shutil.copyfileobj(sys.stdin.buffer,file_obj,config['chunk-size'])
+    elif args.result != None:
+        try:
+            file_obj = open(args.result,"rb")
+        except OSError as e:
+            exit_with_error(1,"Could not open " + args.result + ": " + str(e))
+    else:
+        file_obj = tempfile.TemporaryFile()
+    file_obj.seek(0,os.SEEK_END)
+    size = file_obj.tell()
+
+    start    = time.monotonic()
+    wait     = config['retry-min']
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            status = send_result(collect_info,file_obj,size,args.exit)
+            if status == 200:
+                break
+            # wrong token or base-name won't fix itself
+            if status in (401,404):
+                exit_with_error(2,"collect said " + str(status) + ", is it collecting for " + collect_info['base-name'] + "?")
+            warn("collect said " + str(status) + ", trying again")
+        except (OSError,http.client.HTTPException) as e:
+            warn("Could not send result: " + str(e) + ", trying again")
+        if time.monotonic() - start + wait > config['deadline']:
+            exit_with_error(1,"Gave up sending result after " + str(attempts) + " tries")
+        # jitter, so a whole series does not retry in lockstep
+        time.sleep(wait * random.uniform(0.5,1))
+        wait = min(wait * 2,config['retry-max'])
+
+    file_obj.close()
+    message("Sent " + str(size) + " bytes, exit " + str(args.exit) + ", sequence " + str(collect_info['sequence']) + ", in " + str(attempts) + " tries")
+
+if __name__ == "__main__":
+    main()
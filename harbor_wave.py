@@ -26,7 +26,9 @@ command_help='''
   list [what] - list things. Use the --terse option for CSV output.
   Subcommands/arguments:
       machines   - Show Virtual Machines in use associated with harbor-wave.
-      Based on VM tag in settings.
+      Based on VM tag in settings. With -G/--group, one line per series with
+      count, regions, sizes, ages and burn rate. With --watch, keeps running
+      and prints only machines added, removed, given an IP or resized.
       
       projects   - List projects on current account
 
@@ -46,14 +48,23 @@ command_help='''
       money-left - How much $$$ you have left on your DO account. also shows
       "Burn Rate", the rate of which harbor-wave machines cost money. burn-rate
       is in dollars per hour, and only shows money used by harbor-wave machines,
-      not the entirity for the account.
+      not the entirity for the account. With --watch, prints a new line only
+      when either changes.
       
     example: harbor-wave list sizes
 
-  spawn <N> - Create a new N new VMs. default is 1
+  spawn <N> - Create a new N new VMs. default is 1. With --ttl 2h or --until
+  "2025-06-01 18:00" the VMs get an expiry tag, and reap destroys them after
 
-  destroy <"ALL"> - Destroy VMs. If ALL is appended, then all harbor-wave VMs
-  will be destroyed, based on tag.
+  scale <N> - Grow or shrink the base-name series to N VMs. Only missing
+  sequence numbers are spawned, and VMs numbered N and up are destroyed
+
+  destroy <"ALL"|base-name ...> - Destroy VMs. If ALL is appended, then all
+  harbor-wave VMs will be destroyed, based on tag, in one API call. One or more
+  base-names can be given to destroy several series at once, default is
+  base-name from config. DNS records of series spawned from this computer
+  come from the inventory, see sync. Use base-name[first-last], i.e.
+  'web[10-49]', to destroy only those sequence numbers.
   
   set [item] [value] - set a config item. See bellow for list of config items.
   Setting a value of "" will reset this item to its default value
@@ -66,6 +77,23 @@ command_help='''
   blank config file. Will not touch the api-key
   
   check-config   - checks if your config settings are valid items
+
+  cache clear    - remove cached regions, sizes, templates, ssh-keys, projects
+  and domains. These are kept in ~/.cache/harbor-wave/, use --refresh to skip
+  the cache for one run
+
+  collect [N]    - gather results from machines spawned with collect-url set.
+  Listens on the collect-url port until all N(or total_vms) have sent one, or
+  Ctrl-C. Results go in ./harborwave-results/BASE-NAME/. See
+  errata/user-data-init/harborwave_report.py for the droplet side
+
+  reap [interval] - destroy machines spawned with --ttl or --until that have
+  expired, along with their DNS. Runs once, or every interval(i.e. 5m) until
+  stopped with Ctrl-C
+
+  sync           - bring the local inventory of spawned machines in line with
+  Digital Ocean. spawn and destroy keep it up to date, use this after spawning
+  or destroying from another computer or the web UI
 '''
 config_help='''
         CONFIG ITEMS:
@@ -74,6 +102,10 @@ config_help='''
    is the only option that does NOT go in the .cfg file, but rather the seperate
    api-key file
 
+   collect-url - http://HOST:PORT/ this computer can be reached at by droplets.
+   If set, spawn puts it and a token for the series in user-data, and the
+   droplets send their results there, see collect. Default: blank, off
+
    domain      - DNS domain. If this is set, then harbor-wave creates a VM with
    a FQDN based on this domain. a DNS A-Record is created for the droplet. Must
    have a domain associated with digital ocean account
@@ -81,12 +113,22 @@ config_help='''
    payload     - Input data from your local machine and made availble over the
    Digital Ocean API, for use with cloud-init or other. This is a string
    unless it starts with FILE:. In this case, file contents are uploaded
+
+   payload-encoding - How the payload goes in user-data. none, or gzip+base64
+   to compress it, for bigger or binary payloads. user-data is capped at 64KiB,
+   spawn checks before making anything. Default: none
+
+   payload-shard - Split a FILE: payload so each VM gets only its part, by
+   sequence number. none, lines, bytes, or files, where FILE: is a directory
+   and each VM gets a tar.gz of its share of the files. Default: none
    
    project     - name of project in account where new machines spawn. If blank
    default is used
 
    region      - digital ocean region code slug to spawn droplets. You can get a
-   list of valid entries with the list-reigons command. Default: nyc1
+   list of valid entries with the list-reigons command. A comma seperated list,
+   nyc1,sfo3 spreads a series over several regions, weights like nyc1:2,sfo3:1
+   send more to some regions than others. Default: nyc1
    
    ssh-key-n   - Interger, index of SSH keys to include when creating virtual
    machines. see list ssh-keys
@@ -106,15 +148,30 @@ config_help='''
    
    wait        - Wait for IP addresses and print them before exiting
 
+   parallel    - Interger, how many droplets spawn will create at the same
+   time. Default: 10
+
+   multi-create - True/False, create up to 10 droplets with one API call.
+   These share user-data, sequence is null and droplets look up their sequence
+   number by hostname in sequence-map. Default: False
+
 '''
 full_help_banner=prog_desc+command_help+config_help
 
 import os,sys,time
+import random
+import threading
 import argparse
 import json
-import digitalocean
-from datetime import datetime, tzinfo, timedelta
-from zoneinfo import ZoneInfo
+import hashlib
+import atexit
+import urllib.parse
+from datetime import datetime, tzinfo, timedelta, timezone
+# python-digitalocean, requests and concurrent.futures are imported by
+# load_api_libs(), only for commands that use the API. see network_commands
+digitalocean       = None
+requests           = None
+ThreadPoolExecutor = None
 
 default_config = {
     "domain"       : "",
@@ -126,8 +183,57 @@ default_config = {
     "base-name"    : "",
     "size"         : "s-1vcpu-1gb",
     "template"     : "",
-    "wait"         : True
+    "wait"         : True,
+    "parallel"     : 10,
+    "multi-create" : False,
+    "payload-encoding" : "none",
+    "payload-shard"    : "none",
+    "collect-url"      : "",
+}
+# same as python-digitalocean's default, so it does not need to be loaded
+default_end_point = "https://api.digitalocean.com/v2/"
+# Digital Ocean's limit on user-data per droplet, in bytes
+max_user_data = 65536
+# how the payload is put in user-data. gzip+base64 is decoded by
+# harborwave_init_meta.py on the droplet
+payload_encodings = ("none","gzip+base64")
+# payload-shard, split a FILE: payload so each droplet gets only its part
+payload_shard_modes = ("none","lines","bytes","files")
+# Digital Ocean takes at most this many names in one droplet create request
+max_multi_create = 10
+# droplets added to a project per API call
+max_project_assign = 50
+# Account items that rarely change, cached on disk. name: API path, query
+# params, JSON key, python-digitalocean class, seconds to keep
+catalog_info = {
+    "regions"  : ("regions/"     , {}                , "regions"  , "Region" , 86400),
+    "sizes"    : ("sizes/"       , {}                , "sizes"    , "Size"   , 86400),
+    "images"   : ("images/"      , {"private":"true"}, "images"   , "Image"  , 600),
+    "ssh-keys" : ("account/keys/", {}                , "ssh_keys" , "SSHKey" , 3600),
+    "projects" : ("projects"     , {}                , "projects" , "Project", 3600),
+    "domains"  : ("domains/"     , {}                , "domains"  , "Domain" , 3600),
 }
+# --refresh, ignore cached catalogs for this run
+refresh_cache = False
+# keep-alive HTTP session shared by every API object, see open_api_session()
+api_session = None
+# commands that talk to the Digital Ocean API
+network_commands = ["list","spawn","destroy","check-config","sync","scale","reap"]
+all_commands     = network_commands + ["help","touch","set","get","print-config","cache","collect"]
+# --trace, records every API request. see api_tracer
+api_trace = None
+# sqlite3 connection to the local inventory, see open_inventory()
+inventory_db = None
+inventory_file_name = "inventory.db"
+# spawn --ttl/--until tag droplets with this and the unix time they expire,
+# i.e. harborwave-expires:1760000000. See reap
+expire_tag_prefix = "harborwave-expires:"
+# collect. secret for per series tokens, kept in the config dir, and where
+# results are saved, under the current directory
+collect_key_file_name = "collect-key"
+collect_dir_name      = "harborwave-results"
+# --ttl and reap intervals, suffix to seconds
+duration_units = {"s":1,"m":60,"h":3600,"d":86400,"w":604800}
 
 class colors:
     '''pretty terminal colors'''
@@ -137,6 +243,268 @@ class colors:
     cyan='\033[36m'
     yellow='\033[93m'
 
+class api_scheduler:
+    '''Every API request goes through here. Wraps a requests session and
+    looks like one to python-digitalocean. Paces requests with a token bucket
+    of 250 a minute, never holds more tokens than RateLimit-Remaining says are
+    left, and once that hits zero, waits for RateLimit-Reset. Retries 429s,
+    and 5xx errors on requests that are safe to repeat, with jittered
+    exponential backoff'''
+    burst        = 250   # Digital Ocean allows 250 requests per minute
+    burst_period = 60.0
+    max_retries  = 5
+    max_backoff  = 30.0  # seconds, longest wait between retries
+    max_nap      = 1.0   # check the bucket again at least this often
+    # POST is not here. A 5xx on a create might still have made the droplet
+    retry_methods = ("GET","HEAD","PUT","DELETE")
+
+    def __init__(self,session):
+        self.session       = session
+        self.lock          = threading.Lock()
+        self.tokens        = float(self.burst)
+        self.rate          = self.burst / self.burst_period
+        self.last_refill   = time.time()
+        # RateLimit-Remaining hit zero, hold everything until then
+        self.resume_at     = 0.0
+        self.request_count = 0
+        self.retry_count   = 0
+        # wall clock time where at least one request was held back
+        self.waiting       = 0
+        self.wait_start    = 0.0
+        self.wait_time     = 0.0
+
+    def nap(self,seconds):
+        '''sleep, and keep track of how long the run was held up'''
+        with self.lock:
+            if self.waiting == 0:
+                self.wait_start = time.time()
+            self.waiting += 1
+        time.sleep(seconds)
+        with self.lock:
+            self.waiting -= 1
+            if self.waiting == 0:
+                self.wait_time += time.time() - self.wait_start
+
+    def take_token(self):
+        '''wait until the bucket lets us send another request'''
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst,self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if now < self.resume_at:
+                    wait = self.resume_at - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.request_count += 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            # short naps, so new RateLimit headers from other threads count
+            self.nap(min(wait,self.max_nap))
+
+    def read_limits(self,reply):
+        '''keep to what Digital Ocean says is left. The limit is a rolling
+        hour, and RateLimit-Reset is only when the oldest request in it stops
+        counting, so Remaining is spent at the normal pace, and only when it
+        runs out do we wait for Reset'''
+        remaining = reply.headers.get("RateLimit-Remaining")
+        reset     = reply.headers.get("RateLimit-Reset")
+        try:
+            remaining = int(remaining)
+            reset     = float(reset)
+        except (TypeError,ValueError):
+            return
+        with self.lock:
+            self.tokens = min(self.tokens,remaining)
+            if remaining < 1 and reset > time.time():
+                self.resume_at = reset
+            elif remaining >= 1:
+                self.resume_at = 0.0
+
+    def backoff(self,attempt,reply=None):
+        '''seconds to wait before retry number attempt, honors Retry-After'''
+        if reply != None and reply.headers.get("Retry-After") != None:
+            try:
+                return float(reply.headers.get("Retry-After")) + random.uniform(0,1)
+            except ValueError:
+                pass
+        return random.uniform(0,min(self.max_backoff,2 ** attempt))
+
+    def request(self,method,url,**kwargs):
+        method = method.upper()
+        attempt = 0
+        while True:
+            self.take_token()
+            start = time.perf_counter()
+            try:
+                reply = self.session.request(method,url,**kwargs)
+            except requests.ConnectionError:
+                if api_trace != None:
+                    api_trace.record(method,url,kwargs,None,time.perf_counter() - start)
+                if method not in self.retry_methods or attempt >= self.max_retries:
+                    raise
+                reply = None
+            if reply != None and api_trace != None:
+                api_trace.record(method,url,kwargs,reply,time.perf_counter() - start)
+            if reply != None:
+                self.read_limits(reply)
+                # 429 means nothing was done, so its safe to send again
+                if reply.status_code != 429:
+                    if reply.status_code < 500 or method not in self.retry_methods:
+                        return reply
+                if attempt >= self.max_retries:
+                    return reply
+            with self.lock:
+                self.retry_count += 1
+            self.nap(self.backoff(attempt,reply))
+            attempt += 1
+
+    def get(self,url,**kwargs):
+        return self.request("GET",url,**kwargs)
+    def post(self,url,**kwargs):
+        return self.request("POST",url,**kwargs)
+    def put(self,url,**kwargs):
+        return self.request("PUT",url,**kwargs)
+    def patch(self,url,**kwargs):
+        return self.request("PATCH",url,**kwargs)
+    def delete(self,url,**kwargs):
+        return self.request("DELETE",url,**kwargs)
+
+    def print_summary(self):
+        '''if we had to wait on the API, say so. goes to STDERR, so --terse
+        output is not mixed up'''
+        if self.retry_count == 0 and self.wait_time < 0.5:
+            return
+        out_line  = "API: %s request(s), %s retried, " % (self.request_count,self.retry_count)
+        out_line += "held up %.1f second(s) by rate limits and retries" % self.wait_time
+        print("harbor-wave: " + out_line, file=sys.stderr)
+
+class api_tracer:
+    '''--trace. Records method, endpoint, status, bytes, latency and the
+    harbor-wave function that asked for it, for every request sent by
+    api_scheduler, retries included. Prints a summary on exit, and can also
+    write every request to a JSON file'''
+    # functions that pass requests along, the caller is whoever called these
+    skip_names = ("request","get","post","put","patch","delete","api_post","api_get_cached")
+
+    def __init__(self,out_file=None):
+        self.lock     = threading.Lock()
+        self.out_file = out_file
+        self.start    = time.perf_counter()
+        self.entries  = []
+
+    def get_caller(self):
+        '''name of the first harbor-wave function up the stack that isn't
+        plumbing. Frames from python-digitalocean are skipped too, unless the
+        thread pool called the library directly, like Droplet.destroy'''
+        frame   = sys._getframe(2)
+        library = "?"
+        while frame != None:
+            if frame.f_globals is globals() and frame.f_code.co_name not in self.skip_names:
+                return frame.f_code.co_name
+            if frame.f_globals.get("__name__","").startswith("digitalocean") and "self" in frame.f_locals:
+                library = type(frame.f_locals['self']).__name__ + "." + frame.f_code.co_name
+            frame = frame.f_back
+        return library
+
+    def get_endpoint(self,url):
+        '''path after the end point, with ids swapped for {id}, so calls to
+        the same endpoint group together'''
+        path = urllib.parse.urlparse(url).path
+        base = urllib.parse.urlparse(get_end_point()).path
+        if path.startswith(base):
+            path = path[len(base):]
+        parts = []
+        for part in path.strip("/").split("/"):
+            # droplets and records have number ids, projects have UUIDs
+            if part.isdigit() or (len(part) == 36 and part.count("-") == 4):
+                part = "{id}"
+            parts.append(part)
+        return "/".join(parts)
+
+    def record(self,method,url,kwargs,reply,latency):
+        sent = kwargs.get("data") or kwargs.get("json") or ""
+        if type(sent) == dict:
+            sent = json.dumps(sent)
+        entry = {
+            "time"     : round(time.perf_counter() - self.start,4),
+            "method"   : method,
+            "endpoint" : self.get_endpoint(url),
+            "status"   : None,
+            "sent"     : len(sent),
+            "received" : 0,
+            "latency"  : round(latency,4),
+            "caller"   : self.get_caller(),
+        }
+        if reply != None:
+            entry['status']   = reply.status_code
+            entry['received'] = len(reply.content)
+        with self.lock:
+            self.entries.append(entry)
+
+    def percentile(self,sorted_list,percent):
+        index = int(round(percent / 100 * (len(sorted_list) - 1)))
+        return sorted_list[index]
+
+    def summary(self):
+        '''return dict of "METHOD endpoint" and caller function totals'''
+        by_endpoint = {}
+        by_caller   = {}
+        for entry in self.entries:
+            key = entry['method'] + " " + entry['endpoint']
+            if key not in by_endpoint:
+                by_endpoint[key] = {"latency":[],"bytes":0,"errors":0}
+            by_endpoint[key]['latency'].append(entry['latency'])
+            by_endpoint[key]['bytes'] += entry['sent'] + entry['received']
+            if entry['status'] == None or entry['status'] >= 400:
+                by_endpoint[key]['errors'] += 1
+            if entry['caller'] not in by_caller:
+                by_caller[entry['caller']] = {"count":0,"seconds":0.0}
+            by_caller[entry['caller']]['count']   += 1
+            by_caller[entry['caller']]['seconds'] += entry['latency']
+
+        for key in by_endpoint:
+            latency = sorted(by_endpoint[key].pop("latency"))
+            by_endpoint[key]['count'] = len(latency)
+            by_endpoint[key]['p50']   = self.percentile(latency,50)
+            by_endpoint[key]['p95']   = self.percentile(latency,95)
+            by_endpoint[key]['max']   = latency[-1]
+        return {"endpoints":by_endpoint,"callers":by_caller}
+
+    def finish(self):
+        '''print summary to STDERR, and write the JSON file if asked'''
+        summary = self.summary()
+        if self.out_file != None:
+            try:
+                file_obj = open(self.out_file,"w")
+                file_obj.write(json.dumps({"requests":self.entries,"summary":summary},indent=4))
+                file_obj.close()
+            except OSError as e:
+                warn("trace: could not write " + self.out_file + ": " + str(e))
+
+        tab_space = 10
+        for key in summary['endpoints']:
+            tab_space = max(tab_space,len(key) + 2)
+        for key in summary['callers']:
+            tab_space = max(tab_space,len(key) + 2)
+        out_lines = []
+        out_lines.append(colors.bold + "ENDPOINT".ljust(tab_space) + "COUNT".ljust(8) + "P50 ms".ljust(8) + "P95 ms".ljust(8) + "MAX ms".ljust(8) + "ERRORS" + colors.reset)
+        for key in sorted(summary['endpoints']):
+            item = summary['endpoints'][key]
+            out_line = key.ljust(tab_space) + str(item['count']).ljust(8) + ("%.0f" % (item['p50'] * 1000)).ljust(8) + ("%.0f" % (item['p95'] * 1000)).ljust(8) + ("%.0f" % (item['max'] * 1000)).ljust(8) + str(item['errors'])
+            out_lines.append(out_line)
+        out_lines.append("")
+        out_lines.append(colors.bold + "FUNCTION".ljust(tab_space) + "COUNT".ljust(8) + "SECONDS" + colors.reset)
+        for key in sorted(summary['callers'],key=lambda k: -summary['callers'][k]['seconds']):
+            item = summary['callers'][key]
+            out_lines.append(key.ljust(tab_space) + str(item['count']).ljust(8) + "%.2f" % item['seconds'])
+        out_lines.append("")
+        out_lines.append(str(len(self.entries)) + " request(s) in %.2f second(s)" % (time.perf_counter() - self.start))
+        print("harbor-wave: trace:", file=sys.stderr)
+        for line in out_lines:
+            print(line, file=sys.stderr)
+
 def message(message):
     print("harbor-wave: " + message)
 
@@ -157,11 +525,11 @@ def check_api_key(key):
     # meta headers before the hexdec
     key_len = 64
     base    = 16
-    # Strip headers, if present
-    key = key.split('_')[-1]
     # Key is a string
     if type(key) != str:
         return False
+    # Strip headers, if present
+    key = key.split('_')[-1]
     # Key is 64 characters long
     if len(key) != key_len:
         return False
@@ -177,30 +545,32 @@ def check_domain_exists(loaded_config):
     '''Check if domain is usable for DNS returns True of False'''
     
     manager = check_and_connect(loaded_config)
-    
+    # cached domain list first
     try:
-        all_domains = manager.get_all_domains()
+        for domain in get_catalog(loaded_config,manager,"domains"):
+            if domain.name == loaded_config['domain']:
+                return True
     except digitalocean.DataReadError:
         exit_with_error(1,"list: DataReadError, check settings and try again")
-        
-    # make a list with just the names
-    domain_list = []
-    for domain in all_domains:
-        domain_list.append(domain.name)
-    
-    # Check if config lines up with what is on DO
-    if loaded_config['domain'] in domain_list:
-        return True
-    else:
+    # Not cached, ask for just this domain, instead of listing every domain
+    # on the account
+    domain_object = digitalocean.Domain(token=loaded_config['api-key'], name=loaded_config['domain'], _session=api_session)
+    try:
+        domain_object.load()
+    except digitalocean.NotFoundError:
         return False
+    except digitalocean.DataReadError:
+        exit_with_error(1,"list: DataReadError, check settings and try again")
+    return True
         
-def check_subdomain_exists(loaded_config,hostname):
-    '''Check if subdomain exists before trying to create it. A-records only. Hostname must be str'''
+def get_dns_index(loaded_config):
+    '''Get all DNS records for the configured domain with one listing, and
+    return a dict of hostname:record for the A-records'''
     
     # Get domain object
     api_key       = loaded_config['api-key']
     domain_name   = loaded_config['domain']
-    domain_object = digitalocean.Domain(token=api_key, name=domain_name)
+    domain_object = digitalocean.Domain(token=api_key, name=domain_name, _session=api_session)
     
     # Get all DNS records for domain from Digital Ocean. Throw an error if domain does not exist
     try:
@@ -208,30 +578,168 @@ def check_subdomain_exists(loaded_config,hostname):
     except:
         raise AttributeError("Domain not found on account. Check config before running this function")
     
-    # Now check if any of these are an A record that matches hostname
+    dns_index = {}
     for item in domain_records:
-        if item.type == "A" and item.name == hostname:
-            return True
-    # If we run through the list and nothing, return false
-    return False
+        if item.type == "A" and item.name not in dns_index:
+            dns_index[item.name] = item
+    return dns_index
 
-def convert_datestamp(in_date):
-    '''takes a string from droplet.createdate, and returns a python datetime object'''
+def convert_datestamp(in_date,local_tz=None):
+    '''takes a string from droplet.createdate, and returns a python datetime
+    object. When converting many, look up local_tz once and pass it in'''
     # this is the format that createdate returns
     # see: https://docs.python.org/3/library/datetime.html#strftime-strptime-behavior
     do_timeformat = "%Y-%m-%dT%XZ"
-    do_timezone   = ZoneInfo("Zulu")
-    local_tz      = datetime.now().astimezone().tzinfo
+    if local_tz == None:
+        local_tz = datetime.now().astimezone().tzinfo
     
-    # get a timedate object out of Digital Ocean's formating, including re-add timezone
+    # get a timedate object out of Digital Ocean's formating, including re-add
+    # timezone. Digital Ocean's is always UTC("Zulu")
     date_obj  = datetime.strptime(in_date,do_timeformat)
-    date_obj  = date_obj.replace(tzinfo=do_timezone)
+    date_obj  = date_obj.replace(tzinfo=timezone.utc)
     # convert to local date
     date_obj  = date_obj.astimezone(local_tz)
     # strip timezone because otherwise maths don't work. ?!?!?
     date_obj  = date_obj.replace(tzinfo=None)
     return date_obj
 
+def parse_duration(in_string):
+    '''"90", "90s", "30m", "2h", "1d" or "1w" to seconds as an int. A plain
+    number is seconds. returns None if it can't be read'''
+    in_string  = in_string.strip().lower()
+    multiplier = 1
+    if len(in_string) >= 1 and in_string[-1] in duration_units:
+        multiplier = duration_units[in_string[-1]]
+        in_string  = in_string[:-1]
+    try:
+        seconds = float(in_string) * multiplier
+    except ValueError:
+        return None
+    if seconds <= 0:
+        return None
+    return int(seconds)
+
+def get_expiry(ttl=None,until=None):
+    '''--ttl or --until to the unix time droplets expire, None if neither is
+    set. until is an ISO 8601 date-time, local time unless it has a timezone'''
+    if ttl != None and until != None:
+        exit_with_error(2,"--ttl and --until can't be used together")
+    if ttl != None:
+        seconds = parse_duration(ttl)
+        if seconds == None:
+            exit_with_error(2,"--ttl: can't read " + ttl + ", use a number of seconds or a suffix like 30m, 2h, 1d")
+        return int(time.time()) + seconds
+    if until != None:
+        try:
+            date_obj = datetime.fromisoformat(until)
+        except ValueError:
+            exit_with_error(2,"--until: can't read " + until + ", use a date-time like \"2025-06-01 18:00\"")
+        if date_obj.tzinfo == None:
+            date_obj = date_obj.astimezone()
+        expires = int(date_obj.timestamp())
+        if expires <= time.time():
+            exit_with_error(2,"--until: " + until + " is in the past")
+        return expires
+    return None
+
+def load_api_libs():
+    '''Import python-digitalocean and friends. They take many times longer to
+    import than get, set, or print-config take to run, so commands that don't
+    use the API never load them'''
+    global digitalocean, requests, ThreadPoolExecutor
+    if digitalocean != None:
+        return
+    try:
+        import digitalocean
+        import digitalocean.baseapi
+        import requests.adapters
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError as e:
+        exit_with_error(2,"Could not load python-digitalocean: " + str(e))
+
+def get_end_point():
+    '''The API URL, python-digitalocean lets this be changed from the environment'''
+    return os.getenv("DIGITALOCEAN_END_POINT",default_end_point)
+
+def open_api_session(loaded_config):
+    '''Open the one keep-alive HTTP session used for the whole run, with a
+    connection pool big enough for the parallel setting. Every API object gets
+    this as its session, so we only pay for TLS once per connection, and every
+    request goes through the api_scheduler'''
+    global api_session
+    if api_session != None:
+        return api_session
+
+    pool_size = 10
+    if type(loaded_config['parallel']) == int and loaded_config['parallel'] > pool_size:
+        pool_size = loaded_config['parallel']
+    http_session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=2,pool_maxsize=pool_size)
+    http_session.mount("https://",adapter)
+    http_session.mount("http://",adapter)
+    api_session = api_scheduler(http_session)
+    atexit.register(api_session.print_summary)
+    return api_session
+
+def use_session(api_objects):
+    '''Point python-digitalocean objects made by the library itself, such as
+    droplets from get_all_droplets, at the shared session. takes a list,
+    returns the same list'''
+    for item in api_objects:
+        item._session = api_session
+    return api_objects
+
+def api_post(loaded_config,path,data):
+    '''POST data to API path over the shared session, and return the JSON
+    reply as a dict. python-digitalocean does its POSTs with requests.post,
+    outside of any session, which means a new connection every time. Raises
+    the same errors as python-digitalocean'''
+    url     = urllib.parse.urljoin(get_end_point(),path)
+    headers = {
+        "Content-Type"  : "application/json",
+        "Authorization" : "Bearer " + loaded_config['api-key'],
+    }
+    timeout = os.getenv(digitalocean.baseapi.REQUEST_TIMEOUT_ENV_VAR)
+    if timeout != None:
+        timeout = float(timeout)
+    reply = api_session.post(url,data=json.dumps(data),headers=headers,timeout=timeout)
+    if reply.status_code == 404:
+        raise digitalocean.NotFoundError()
+    try:
+        reply_data = reply.json()
+    except ValueError as e:
+        raise digitalocean.baseapi.JSONReadError("Read failed from DigitalOcean: " + str(e))
+    if reply.ok != True:
+        raise digitalocean.DataReadError(reply_data.get("message",str(reply.status_code)))
+    return reply_data
+
+def api_get_cached(loaded_config,path,params,etags):
+    '''GET API path over the shared session and return the JSON reply as a
+    dict. etags is a dict the caller keeps between calls. If an earlier reply
+    for the same request had an ETag, ask with If-None-Match, and on 304 Not
+    Modified return what we got last time. Raises the same errors as
+    python-digitalocean'''
+    url     = urllib.parse.urljoin(get_end_point(),path)
+    key     = url + "?" + urllib.parse.urlencode(sorted(params.items()))
+    headers = {"Authorization" : "Bearer " + loaded_config['api-key']}
+    if key in etags:
+        headers['If-None-Match'] = etags[key][0]
+    timeout = os.getenv(digitalocean.baseapi.REQUEST_TIMEOUT_ENV_VAR)
+    if timeout != None:
+        timeout = float(timeout)
+    reply = api_session.get(url,params=params,headers=headers,timeout=timeout)
+    if reply.status_code == 304 and key in etags:
+        return etags[key][1]
+    try:
+        reply_data = reply.json()
+    except ValueError as e:
+        raise digitalocean.baseapi.JSONReadError("Read failed from DigitalOcean: " + str(e))
+    if reply.ok != True:
+        raise digitalocean.DataReadError(reply_data.get("message",str(reply.status_code)))
+    if reply.headers.get("ETag") != None:
+        etags[key] = (reply.headers.get("ETag"),reply_data)
+    return reply_data
+
 def check_and_connect(loaded_config):
     '''give the loaded config, check the API key, and return a DO manager session'''
     
@@ -246,50 +754,522 @@ def check_and_connect(loaded_config):
         exit_with_error(2,"Invalid API Key")
         
     # get open a session
-    manager = digitalocean.Manager(token=api_key)
+    open_api_session(loaded_config)
+    manager = digitalocean.Manager(token=api_key,_session=api_session)
     
     return manager
 
+def get_account_id(loaded_config):
+    '''short hash of the API key and end point, so cache and inventory keep
+    accounts apart without storing the key'''
+    if loaded_config['api-key'] == None or loaded_config['api-key'] == "":
+        exit_with_error(2,"No api-key set, cache and inventory are kept per account. Use set api-key or --api-key")
+    account_id = loaded_config['api-key'] + "@" + get_end_point()
+    return hashlib.sha256(account_id.encode()).hexdigest()[:16]
+
+def get_cache_root():
+    '''~/.cache/harbor-wave, or under XDG_CACHE_HOME if set'''
+    cache_root = os.getenv("XDG_CACHE_HOME")
+    if cache_root == None or cache_root == "":
+        cache_root = os.getenv("HOME") + "/.cache"
+    return cache_root + "/harbor-wave"
+
+def get_cache_dir(loaded_config):
+    '''Directory for cached catalogs, one per API key and API end point, so
+    accounts do not see each other's data'''
+    return get_cache_root() + "/" + get_account_id(loaded_config)
+
+def get_catalog(loaded_config,manager,catalog,refresh=False):
+    '''Get a list of account items(regions, sizes, images, ssh-keys, projects,
+    domains) as python-digitalocean objects. Comes from the on-disk cache if it
+    is younger than the catalog's TTL, otherwise from the API, and is then
+    cached. refresh=True, or the --refresh switch, skips the cache'''
+    path, params, json_key, obj_class, ttl = catalog_info[catalog]
+    cache_file = get_cache_dir(loaded_config) + "/" + catalog + ".json"
+
+    items = None
+    if refresh == False and refresh_cache == False:
+        try:
+            file_obj = open(cache_file,"r")
+            contents = json.loads(file_obj.read())
+            file_obj.close()
+            if time.time() - contents['fetched'] < ttl:
+                items = contents['items']
+        except:
+            items = None
+
+    if items == None:
+        items = manager.get_data(path,params=dict(params))[json_key]
+        contents = json.dumps({"fetched":time.time(),"items":items})
+        # write to a temp file and move it in place, so parallel runs never
+        # see half a file
+        try:
+            os.makedirs(os.path.dirname(cache_file),mode=0o700,exist_ok=True)
+            temp_file = cache_file + "." + str(os.getpid())
+            file_obj = open(temp_file,"w")
+            file_obj.write(contents)
+            file_obj.close()
+            os.replace(temp_file,cache_file)
+        except:
+            warn("could not write cache file " + cache_file)
+
+    obj_class = getattr(digitalocean,obj_class)
+    out_list  = []
+    for jsoned in items:
+        item = obj_class(_session=api_session,**jsoned)
+        item.token = manager.token
+        out_list.append(item)
+    return out_list
+
+def clear_cache(loaded_config,terse=False):
+    '''the cache clear command, remove cached catalogs for this account. With
+    no api-key, the whole cache, every account'''
+    if loaded_config['api-key'] == None or loaded_config['api-key'] == "":
+        import shutil
+        cache_root = get_cache_root()
+        try:
+            shutil.rmtree(cache_root)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            exit_with_error(1,"cache: could not remove " + cache_root + ": " + str(e))
+        if terse == False:
+            message("No api-key set, cleared all cached catalogs from " + cache_root)
+        return
+    cache_dir = get_cache_dir(loaded_config)
+    removed   = 0
+    for catalog in catalog_info:
+        cache_file = cache_dir + "/" + catalog + ".json"
+        if os.path.exists(cache_file) == True:
+            try:
+                os.remove(cache_file)
+                removed += 1
+            except:
+                exit_with_error(1,"cache: could not remove " + cache_file)
+    if terse == False:
+        message("Cleared " + str(removed) + " cached catalog(s) from " + cache_dir)
+
+class machine_row:
+    '''Just the droplet fields list machines and sync use. A full Droplet
+    object holds the whole API reply, which adds up with thousands of droplets'''
+    __slots__ = ("id","name","ip_address","private_ip_address","region","size","price_hourly","template","created_at","expires")
+
+    def __init__(self,droplet_json):
+        self.id           = droplet_json['id']
+        self.name         = droplet_json['name']
+        self.region       = droplet_json['region']['slug']
+        self.size         = droplet_json['size_slug']
+        self.price_hourly = droplet_json['size']['price_hourly']
+        self.template     = droplet_json['image']['name']
+        self.created_at   = droplet_json['created_at']
+        # unix time from the expiry tag, if spawned with --ttl or --until
+        self.expires      = None
+        for tag in droplet_json.get('tags',[]):
+            if tag.startswith(expire_tag_prefix) and tag[len(expire_tag_prefix):].isdigit():
+                self.expires = int(tag[len(expire_tag_prefix):])
+        # same as Droplet.ip_address, the public IPv4 address or None
+        self.ip_address         = None
+        self.private_ip_address = None
+        for network in droplet_json['networks']['v4']:
+            if network['type'] == "public":
+                self.ip_address = network['ip_address']
+            elif network['type'] == "private":
+                self.private_ip_address = network['ip_address']
+
+def iter_machine_pages(loaded_config,manager,etags=None):
+    '''yield a list of machine_row for each page of droplets with our tag as
+    they come in, instead of waiting for all of them. With etags, a dict kept
+    between calls, pages that did not change are not sent again, see
+    api_get_cached'''
+    params = {"tag_name":loaded_config['tag'],"per_page":200,"page":1}
+    while True:
+        if etags != None:
+            data = api_get_cached(loaded_config,"droplets/",params,etags)
+        else:
+            # with "page" set, python-digitalocean gets only that page
+            data = manager.get_data("droplets/",params=params)
+        page = []
+        for droplet_json in data['droplets']:
+            page.append(machine_row(droplet_json))
+        yield page
+        if "next" not in data.get("links",{}).get("pages",{}):
+            return
+        params['page'] += 1
+
+def open_inventory(loaded_config):
+    '''Open the local inventory of spawned droplets, in the config dir. spawn
+    adds to it, destroy takes away, and sync brings it in line with the API.
+    The inventory only saves API calls, so if it can't be opened we warn and
+    carry on without it'''
+    global inventory_db
+    if inventory_db != None:
+        return inventory_db
+    import sqlite3
+    inventory_file = os.getenv("HOME") + "/.config/harbor-wave/" + inventory_file_name
+    try:
+        inventory_db = sqlite3.connect(inventory_file)
+        inventory_db.execute('''CREATE TABLE IF NOT EXISTS droplets (
+            account       TEXT NOT NULL,
+            id            INTEGER NOT NULL,
+            name          TEXT NOT NULL,
+            series        TEXT NOT NULL,
+            sequence      INTEGER,
+            tag           TEXT,
+            region        TEXT,
+            size          TEXT,
+            public_ip     TEXT,
+            private_ip    TEXT,
+            dns_record_id INTEGER,
+            created_at    TEXT,
+            PRIMARY KEY (account,id) )''')
+        inventory_db.execute("CREATE INDEX IF NOT EXISTS droplets_series ON droplets (account,tag,series)")
+        inventory_db.execute("CREATE TABLE IF NOT EXISTS sync_state (account TEXT, tag TEXT, synced_at TEXT, PRIMARY KEY (account,tag))")
+        inventory_db.commit()
+        os.chmod(inventory_file,0o640)
+    except (sqlite3.Error,OSError) as e:
+        warn("inventory: could not open " + inventory_file + ": " + str(e))
+        inventory_db = None
+    return inventory_db
+
+def inventory_add(loaded_config,machine_list,sequence_map={},record_ids={}):
+    '''add freshly spawned droplets to the inventory. sequence_map is name:
+    sequence, record_ids is hostname:DNS record id'''
+    db = open_inventory(loaded_config)
+    if db == None:
+        return
+    account = get_account_id(loaded_config)
+    rows    = []
+    for machine in machine_list:
+        hostname = machine.name.split(".")[0]
+        rows.append( (account,machine.id,machine.name,loaded_config['base-name'],sequence_map.get(machine.name),loaded_config['tag'],
+          machine.region['slug'],machine.size_slug,machine.ip_address,machine.private_ip_address,record_ids.get(hostname),machine.created_at) )
+    db.executemany("INSERT OR REPLACE INTO droplets VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",rows)
+    db.commit()
+
+def inventory_remove(loaded_config,droplet_ids):
+    '''take destroyed droplets out of the inventory'''
+    db = open_inventory(loaded_config)
+    if db == None:
+        return
+    account = get_account_id(loaded_config)
+    db.executemany("DELETE FROM droplets WHERE account=? AND id=?",[(account,droplet_id) for droplet_id in droplet_ids])
+    db.commit()
+
+def inventory_machines(loaded_config,base_names):
+    '''droplets in the inventory with our tag, with names that start with any
+    of base_names, the same way destroy matches them from a listing. Returns
+    a list of (id,name,public_ip,dns_record_id)'''
+    db = open_inventory(loaded_config)
+    if db == None:
+        return []
+    account  = get_account_id(loaded_config)
+    out_list = []
+    seen_ids = set()
+    for base_name in base_names:
+        query  = "SELECT id,name,public_ip,dns_record_id FROM droplets WHERE account=? AND tag=? AND substr(name,1,?)=? ORDER BY series,sequence"
+        for row in db.execute(query,(account,loaded_config['tag'],len(base_name),base_name)):
+            # base_names can overlap, i.e. web and web1
+            if row[0] not in seen_ids:
+                seen_ids.add(row[0])
+                out_list.append(row)
+    return out_list
+
+def sync_inventory(loaded_config,terse=False):
+    '''Bring the inventory in line with the droplets that have our tag. Goes
+    page by page, and only writes rows that changed. With a domain set, DNS
+    record ids are filled in from one listing of the domain'''
+    manager = check_and_connect(loaded_config)
+    db      = open_inventory(loaded_config)
+    if db == None:
+        exit_with_error(1,"sync: could not open inventory")
+    account = get_account_id(loaded_config)
+    vm_tag  = loaded_config['tag']
+
+    if terse == False:
+        message("Syncing inventory for tag: " + vm_tag)
+    known = {}
+    for row in db.execute("SELECT id,name,region,size,public_ip,private_ip FROM droplets WHERE account=? AND tag=?",(account,vm_tag)):
+        known[row[0]] = row[1:]
+
+    added     = 0
+    updated   = 0
+    unchanged = 0
+    seen      = set()
+    try:
+        for page in iter_machine_pages(loaded_config,manager):
+            for machine in page:
+                seen.add(machine.id)
+                fields = (machine.name,machine.region,machine.size,machine.ip_address,machine.private_ip_address)
+                if known.get(machine.id) == fields:
+                    unchanged += 1
+                    continue
+                if machine.id in known:
+                    db.execute("UPDATE droplets SET name=?,region=?,size=?,public_ip=?,private_ip=? WHERE account=? AND id=?",fields + (account,machine.id))
+                    updated += 1
+                else:
+                    hostname = machine.name.split(".")[0]
+                    series   = get_series_name(machine.name)
+                    sequence = 0
+                    if hostname[len(series):].isdigit():
+                        sequence = int(hostname[len(series):])
+                    db.execute("INSERT OR REPLACE INTO droplets VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                      (account,machine.id,machine.name,series,sequence,vm_tag,machine.region,machine.size,machine.ip_address,machine.private_ip_address,None,machine.created_at))
+                    added += 1
+            db.commit()
+    except digitalocean.DataReadError:
+        exit_with_error(2,"sync: DataReadError, check settings and try again")
+
+    gone = []
+    for droplet_id in known:
+        if droplet_id not in seen:
+            gone.append(droplet_id)
+    inventory_remove(loaded_config,gone)
+
+    # match DNS records to droplets by hostname
+    if loaded_config['domain'] != "":
+        try:
+            dns_index = get_dns_index(loaded_config)
+        except:
+            dns_index = {}
+            warn("sync: could not get DNS records for " + loaded_config['domain'])
+        rows = []
+        for row in db.execute("SELECT id,name FROM droplets WHERE account=? AND tag=?",(account,vm_tag)):
+            hostname = row[1].split(".")[0]
+            if hostname in dns_index:
+                rows.append( (dns_index[hostname].id,account,row[0]) )
+        db.executemany("UPDATE droplets SET dns_record_id=? WHERE account=? AND id=?",rows)
+    db.execute("INSERT OR REPLACE INTO sync_state VALUES (?,?,?)",(account,vm_tag,datetime.now(timezone.utc).isoformat()))
+    db.commit()
+
+    if terse == False:
+        submsg(str(added) + " added, " + str(updated) + " updated, " + str(len(gone)) + " removed, " + str(unchanged) + " unchanged")
+        message("Done")
+    else:
+        print(",".join([str(added),str(updated),str(len(gone)),str(unchanged)]))
+
+def format_machine(machine,local_tz,now,terse=False):
+    '''one list machines line for a machine_row'''
+    tab_spacing = 20
+    # get how long machine has been running
+    droplet_start_obj = convert_datestamp(machine.created_at,local_tz)
+    time_running = str(now - droplet_start_obj)
+    if terse == False:
+        out_line = machine.name + "\t" + str(machine.ip_address) + "\t" + machine.region + "\t" + machine.size + "\t" + machine.template + "\t" + time_running
+        out_line = out_line.expandtabs(tab_spacing)
+    else:
+        out_line = machine.name + "," + str(machine.ip_address) + "," + machine.region + "," + machine.size + "," + machine.template + ',' + time_running
+    return out_line
+
 def list_machines(loaded_config,terse=False):
     '''give a list of droplets in project, nomially ones created with this prog.
     if terse is True, then print in CSV format for grep and cut'''
     
     manager = check_and_connect(loaded_config)
-    droplet_tag = loaded_config['tag']
-    try:
-        droplet_list = manager.get_all_droplets(tag_name=droplet_tag)
-    except digitalocean.DataReadError:
-        exit_with_error(2,"list: DataReadError, check settings and try again")
     
     tab_spacing = 20
     header  = colors.bold + "NAME\tIP ADDRESS\tREGION\tSIZE\tTEMPLATE\t\tTIME RUNNING(H:M:S.µS)".expandtabs(tab_spacing) + colors.reset
     out_line = ""
+    if terse != False and terse != True:
+        exit_with_error(10,"list: machines: terse is neither True nor False, should never get here, debug!")
     if terse == False:
         print(header)
-        for droplet in droplet_list:
-            # get how long machine has been running
-            droplet_start_obj = convert_datestamp(droplet.created_at)
-            time_running = datetime.now() - droplet_start_obj
-            time_running = str(time_running)
-            out_line = droplet.name + "\t" + str(droplet.ip_address) + "\t" + droplet.region['slug'] + "\t" + droplet.size['slug'] + "\t" + droplet.image['name'] + "\t" + time_running
-            out_line = out_line.expandtabs(tab_spacing)
-            print(out_line)
-    elif terse == True:
-        for droplet in droplet_list:
-            droplet_start_obj = convert_datestamp(droplet.created_at)
-            time_running = datetime.now() - droplet_start_obj
-            time_running = str(time_running)
-            out_line = droplet.name + "," + str(droplet.ip_address) + "," + droplet.region['slug'] + "," + droplet.size['slug'] + "," + droplet.image['name'] + ',' + time_running
-            print(out_line)
-    else:
+    # once per run, not per droplet
+    local_tz = datetime.now().astimezone().tzinfo
+    now      = datetime.now()
+    try:
+        for page in iter_machine_pages(loaded_config,manager):
+            for machine in page:
+                print(format_machine(machine,local_tz,now,terse))
+            # show each page as it comes, even into a pipe
+            sys.stdout.flush()
+    except digitalocean.DataReadError:
+        exit_with_error(2,"list: DataReadError, check settings and try again")
+    except BrokenPipeError:
+        # reader went away, i.e. | head. Don't print a traceback on the way out
+        os.dup2(os.open(os.devnull,os.O_WRONLY),sys.stdout.fileno())
+        sys.exit(0)
+
+def get_machine_snapshot(loaded_config,manager,etags=None):
+    '''every droplet with our tag, as a dict of id:machine_row'''
+    machines = {}
+    for page in iter_machine_pages(loaded_config,manager,etags):
+        for machine in page:
+            machines[machine.id] = machine
+    return machines
+
+def diff_machines(old_machines,new_machines):
+    '''what changed between two snapshots from get_machine_snapshot. returns
+    a list of (event,machine,detail), event is one of added, removed, ip or
+    changed'''
+    out_list = []
+    for droplet_id in new_machines:
+        machine = new_machines[droplet_id]
+        if droplet_id not in old_machines:
+            out_list.append( ("added",machine,"") )
+            continue
+        old = old_machines[droplet_id]
+        if old.ip_address != machine.ip_address:
+            out_list.append( ("ip",machine,str(old.ip_address) + " -> " + str(machine.ip_address)) )
+        if old.size != machine.size or old.region != machine.region or old.name != machine.name:
+            out_list.append( ("changed",machine,old.name + " " + old.region + " " + old.size + " -> " + machine.name + " " + machine.region + " " + machine.size) )
+    for droplet_id in old_machines:
+        if droplet_id not in new_machines:
+            out_list.append( ("removed",old_machines[droplet_id],"") )
+    return out_list
+
+def get_burn_rate(machines):
+    '''dollars per hour for a snapshot from get_machine_snapshot'''
+    burn_rate = float(0)
+    for droplet_id in machines:
+        burn_rate += machines[droplet_id].price_hourly
+    return round(burn_rate,5)
+
+def watch_loop(interval,poll):
+    '''call poll() every interval until Ctrl-C. A poll that fails is warned
+    about and tried again next time, so a network blip doesn't end the watch'''
+    seconds = parse_duration(interval)
+    if seconds == None:
+        exit_with_error(2,"--watch: can't read interval " + interval + ", use a number of seconds or a suffix like 30s, 5m")
+    try:
+        while True:
+            started = time.time()
+            try:
+                poll()
+            except digitalocean.Error as e:
+                warn("watch: could not refresh, trying again next interval: " + str(e))
+            except requests.RequestException as e:
+                warn("watch: could not refresh, trying again next interval: " + str(e))
+            sys.stdout.flush()
+            time.sleep(max(seconds - (time.time() - started),0))
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull,os.O_WRONLY),sys.stdout.fileno())
+        sys.exit(0)
+
+def watch_machines(loaded_config,interval,terse=False):
+    '''list machines --watch. Print the list once, then every interval, only
+    what changed: machines added or removed, IPs assigned, resizes, and the
+    burn rate when it moves. One tag listing per interval, with conditional
+    requests if the API sends ETags'''
+    manager = check_and_connect(loaded_config)
+    etags   = {}
+    state   = {}
+    tab_spacing = 20
+    local_tz    = datetime.now().astimezone().tzinfo
+    event_color = {"added":colors.cyan,"removed":colors.red,"ip":colors.yellow,"changed":colors.yellow}
+
+    def poll():
+        machines = get_machine_snapshot(loaded_config,manager,etags)
+        stamp    = datetime.now().strftime("%H:%M:%S")
+        if "machines" not in state:
+            now = datetime.now()
+            if terse == False:
+                print(colors.bold + "NAME\tIP ADDRESS\tREGION\tSIZE\tTEMPLATE\t\tTIME RUNNING(H:M:S.µS)".expandtabs(tab_spacing) + colors.reset)
+            for droplet_id in machines:
+                print(format_machine(machines[droplet_id],local_tz,now,terse))
+            if terse == False:
+                message("Watching " + str(len(machines)) + " machine(s), burn rate $" + str(get_burn_rate(machines)) + "/hour, every " + interval + ". Ctrl-C to stop")
+        else:
+            for event,machine,detail in diff_machines(state['machines'],machines):
+                if terse == False:
+                    # pad before coloring, color codes throw off expandtabs
+                    out_line = machine.name + "\t" + str(machine.ip_address) + "\t" + machine.region + "\t" + machine.size + "\t" + detail
+                    print(stamp + "  " + event_color[event] + event.upper().ljust(10) + colors.reset + out_line.expandtabs(tab_spacing))
+                else:
+                    print(stamp + "," + event + "," + machine.name + "," + str(machine.ip_address) + "," + machine.region + "," + machine.size + "," + detail)
+            old_rate = get_burn_rate(state['machines'])
+            new_rate = get_burn_rate(machines)
+            if new_rate != old_rate:
+                if terse == False:
+                    print(stamp + "  " + colors.bold + "BURN RATE".ljust(10) + colors.reset + "$" + str(old_rate) + " -> $" + str(new_rate) + "/hour, " + str(len(machines)) + " machine(s)")
+                else:
+                    print(stamp + ",burn-rate,,,,," + str(old_rate) + " -> " + str(new_rate))
+        state['machines'] = machines
+
+    watch_loop(interval,poll)
+
+class series_summary:
+    '''running totals for one series in list machines --group'''
+    __slots__ = ("count","regions","sizes","oldest","newest","burn_rate")
+
+    def __init__(self):
+        self.count     = 0
+        self.regions   = set()
+        self.sizes     = set()
+        self.oldest    = None
+        self.newest    = None
+        self.burn_rate = 0.0
+
+    def add(self,machine):
+        self.count     += 1
+        self.burn_rate += machine.price_hourly
+        self.regions.add(machine.region)
+        self.sizes.add(machine.size)
+        # Digital Ocean datestamps sort as strings, only parse the two we keep
+        if self.oldest == None or machine.created_at < self.oldest:
+            self.oldest = machine.created_at
+        if self.newest == None or machine.created_at > self.newest:
+            self.newest = machine.created_at
+
+def get_series_name(machine_name):
+    '''base-name of the series a droplet belongs to. spawn names droplets
+    base-name and sequence number, plus the domain if one is set'''
+    hostname = machine_name.split(".")[0]
+    series   = hostname.rstrip("0123456789")
+    if series == "":
+        return hostname
+    return series
+
+def list_machine_series(loaded_config,terse=False):
+    '''list machines --group. One line per series instead of per droplet, with
+    count, regions, sizes, oldest and newest age, and burn rate. Done in one
+    pass over the droplet pages, only the totals are kept'''
+    manager = check_and_connect(loaded_config)
+    if terse != False and terse != True:
         exit_with_error(10,"list: machines: terse is neither True nor False, should never get here, debug!")
 
+    series_list = {}
+    try:
+        for page in iter_machine_pages(loaded_config,manager):
+            for machine in page:
+                series = get_series_name(machine.name)
+                if series not in series_list:
+                    series_list[series] = series_summary()
+                series_list[series].add(machine)
+    except digitalocean.DataReadError:
+        exit_with_error(2,"list: DataReadError, check settings and try again")
+
+    local_tz    = datetime.now().astimezone().tzinfo
+    now         = datetime.now()
+    tab_spacing = 16
+    total_count = 0
+    total_burn  = 0.0
+    if terse == False:
+        header = colors.bold + "SERIES\tCOUNT\tREGIONS\tSIZES\tOLDEST\tNEWEST\tBURN RATE($/HOUR)".expandtabs(tab_spacing) + colors.reset
+        print(header)
+    for series in sorted(series_list):
+        item   = series_list[series]
+        oldest = str(now - convert_datestamp(item.oldest,local_tz)).split(".")[0]
+        newest = str(now - convert_datestamp(item.newest,local_tz)).split(".")[0]
+        total_count += item.count
+        total_burn  += item.burn_rate
+        if terse == False:
+            out_line = series + "\t" + str(item.count) + "\t" + ",".join(sorted(item.regions)) + "\t" + ",".join(sorted(item.sizes)) + "\t" + oldest + "\t" + newest + "\t" + "$" + str(round(item.burn_rate,5))
+            out_line = out_line.expandtabs(tab_spacing)
+        else:
+            out_line = series + "," + str(item.count) + "," + " ".join(sorted(item.regions)) + "," + " ".join(sorted(item.sizes)) + "," + oldest + "," + newest + "," + str(round(item.burn_rate,5))
+        print(out_line)
+    if terse == False:
+        out_line = "TOTAL\t" + str(total_count) + "\t\t\t\t\t" + "$" + str(round(total_burn,5))
+        print(colors.bold + out_line.expandtabs(tab_spacing) + colors.reset)
+
 def list_templates(loaded_config,terse=False):
     '''List available templates to make machines from. Takes one parameter, the config dict '''    
     # get images
     manager = check_and_connect(loaded_config)
     try:
-        all_images = manager.get_my_images()
+        all_images = get_catalog(loaded_config,manager,"images")
     except digitalocean.DataReadError:
         exit_with_error(2,"list: DataReadError, check settings and try again")
     
@@ -321,7 +1301,7 @@ def list_regions(loaded_config,terse=False):
     # get regions
     manager = check_and_connect(loaded_config)
     try:
-        regions = manager.get_all_regions()
+        regions = get_catalog(loaded_config,manager,"regions")
     except digitalocean.DataReadError:
         exit_with_error(2,"list: DataReadError, check settings and try again")
         
@@ -353,7 +1333,7 @@ def list_sizes(loaded_config,terse=False):
     # get VM sizes
     manager = check_and_connect(loaded_config)
     try:
-        avail_sizes = manager.get_all_sizes()
+        avail_sizes = get_catalog(loaded_config,manager,"sizes")
     except digitalocean.DataReadError:
         exit_with_error(2,"list: DataReadError, check settings and try again")
     
@@ -383,7 +1363,7 @@ def list_projects(loaded_config,terse=False):
     manager = check_and_connect(loaded_config)
     
     try:
-        projects = manager.get_all_projects()
+        projects = get_catalog(loaded_config,manager,"projects")
     except digitalocean.DataReadError:
         exit_with_error(2,"list: DataReadError, check settings and try again")
     
@@ -408,13 +1388,17 @@ def list_account_balance(loaded_config,terse=False):
     # get funds
     manager = check_and_connect(loaded_config)
     try:
-        funds = manager.get_balance()
+        funds = digitalocean.Balance(token=loaded_config['api-key'],_session=api_session)
+        funds.load()
     except digitalocean.DataReadError:
         exit_with_error(2,"list: DataReadError, check settings and try again")    
 
-    droplet_tag = loaded_config['tag']
+    # get total burn rate from harbor-wave VMs
+    burn_rate = float(0)
     try:
-        droplet_list = manager.get_all_droplets(tag_name=droplet_tag)
+        for page in iter_machine_pages(loaded_config,manager):
+            for machine in page:
+                burn_rate += machine.price_hourly
     except digitalocean.DataReadError:
         exit_with_error(2,"list: DataReadError, check settings and try again")
    
@@ -423,12 +1407,6 @@ def list_account_balance(loaded_config,terse=False):
     balance     = abs(float(funds.account_balance))
     remaining   = round(balance - used_so_far,2)
     
-    # get total burn rate from harbor-wave VMs
-    burn_rate = float(0)
-
-    for item in droplet_list:
-        burn_rate += item.size['price_hourly']
-    
     #print
     banner = "Finances"
     tab_space = 18
@@ -447,13 +1425,43 @@ def list_account_balance(loaded_config,terse=False):
     else:
         exit_with_error(10,"list: money-left: terse neither True nor False, should not be here, debug!")
 
+def watch_account_balance(loaded_config,interval,terse=False):
+    '''list money-left --watch. Print remaining funds and burn rate, then a new
+    line each interval only when one of them changed'''
+    manager = check_and_connect(loaded_config)
+    etags   = {}
+    state   = {}
+
+    def poll():
+        funds       = api_get_cached(loaded_config,"customers/my/balance",{},etags)
+        burn_rate   = get_burn_rate(get_machine_snapshot(loaded_config,manager,etags))
+        used_so_far = float(funds['month_to_date_usage'])
+        balance     = abs(float(funds['account_balance']))
+        remaining   = round(balance - used_so_far,2)
+        if state.get("last") == (remaining,burn_rate):
+            return
+        stamp = datetime.now().strftime("%H:%M:%S")
+        if terse == False:
+            if "last" not in state:
+                message("Finances, every " + interval + ". Ctrl-C to stop")
+            output = stamp + "  " + colors.bold + "Remaining Funds: " + colors.reset + "$" + str(remaining)
+            output += "  " + colors.bold + "Burn Rate($/Hour): " + colors.reset + "$" + str(burn_rate)
+            if "last" in state and state['last'][1] != burn_rate:
+                output += " (was $" + str(state['last'][1]) + ")"
+            print(output)
+        else:
+            print(stamp + "," + str(remaining) + "," + str(burn_rate))
+        state['last'] = (remaining,burn_rate)
+
+    watch_loop(interval,poll)
+
 def list_ssh_keys(loaded_config,terse=False):
     '''List SSH keys registered to your digital ocean account'''
         
     # get VM sizes
     manager = check_and_connect(loaded_config)
     try:
-        ssh_keys = manager.get_all_sshkeys()
+        ssh_keys = get_catalog(loaded_config,manager,"ssh-keys")
     except digitalocean.DataReadError:
         exit_with_error(2,"list: DataReadError, check settings and try again")  
     
@@ -480,7 +1488,7 @@ def list_domains(loaded_config,terse=False):
     # get Domains
     manager = check_and_connect(loaded_config)
     try:
-        domains = manager.get_all_domains()
+        domains = get_catalog(loaded_config,manager,"domains")
     except digitalocean.DataReadError:
         exit_with_error(2,"list: DataReadError, check settings and try again")
     
@@ -503,94 +1511,491 @@ def list_domains(loaded_config,terse=False):
     for domain in domain_list:
         print(domain)
 
-def create_machine(loaded_config,machine_name,ssh_key,user_meta=""):
+def create_machine(loaded_config,machine_name,ssh_key,user_meta="",region=None,tags=None):
     '''Creates a single virtual-machine, uses machine_name variable for name,
     ignores base-name in config. This is a base class that does no checking
     or iteration. must also pass the SSH key, to only have to load it once
     Also does not mess with DNS. returns True or False, depending on if success
     or not
     '''
+    if region == None:
+        region = loaded_config['region']
+    if tags == None:
+        tags = [ loaded_config['tag'] ]
     
-    manager  = check_and_connect(loaded_config)
-    new_vm  = digitalocean.Droplet(token=loaded_config['api-key'],
-                                    name=machine_name,
-                                    region=loaded_config['region'],
-                                    image=loaded_config['template'],
-                                    size_slug=loaded_config['size'],
-                                    tags=[ loaded_config['tag'] ],
-                                    ssh_keys= [ ssh_key ],
-                                    user_data=user_meta,
-                                    backups=False )
-    new_vm.create()
+    create_data = {
+        "name"      : machine_name,
+        "region"    : region,
+        "image"     : loaded_config['template'],
+        "size"      : loaded_config['size'],
+        "tags"      : tags,
+        "ssh_keys"  : [ ssh_key.id ],
+        "backups"   : False,
+    }
+    if user_meta != "":
+        create_data['user_data'] = user_meta
+    reply  = api_post(loaded_config,"droplets/",create_data)
+    new_vm = digitalocean.Droplet(token=loaded_config['api-key'],_session=api_session,**reply['droplet'])
     
-    #Add to project
-    if loaded_config['project'] != None and loaded_config['project'] != "":
-        use_project = None
-        projects = manager.get_all_projects()
+    # return VM for use in array later
+    return new_vm
+
+def create_machines(loaded_config,machine_names,ssh_key,user_meta="",region=None,tags=None):
+    '''Like create_machine, but makes up to max_multi_create machines with one
+    API call. All machines share the same user_meta and region. returns a list
+    of droplets
+    '''
+    if len(machine_names) > max_multi_create:
+        raise ValueError("create_machines: can't create more than " + str(max_multi_create) + " machines per request")
+    if region == None:
+        region = loaded_config['region']
+    if tags == None:
+        tags = [ loaded_config['tag'] ]
+
+    create_data = {
+        "names"     : machine_names,
+        "region"    : region,
+        "image"     : loaded_config['template'],
+        "size"      : loaded_config['size'],
+        "tags"      : tags,
+        "ssh_keys"  : [ ssh_key.id ],
+        "backups"   : False,
+    }
+    if user_meta != "":
+        create_data['user_data'] = user_meta
+    reply   = api_post(loaded_config,"droplets/",create_data)
+    new_vms = []
+    for droplet_json in reply['droplets']:
+        new_vms.append(digitalocean.Droplet(token=loaded_config['api-key'],_session=api_session,**droplet_json))
+    return new_vms
+
+def parse_regions(region_value):
+    '''region config item to a list of (region,weight). Takes one region, a
+    comma seperated list "nyc1,nyc3,sfo3", or weights "nyc1:2,sfo3:1". returns
+    None if it can't be read'''
+    out_list = []
+    for item in region_value.split(","):
+        item = item.strip()
+        if ":" in item:
+            region,weight = item.split(":",1)
+            try:
+                weight = int(weight)
+            except ValueError:
+                return None
+        else:
+            region = item
+            weight = 1
+        if region == "" or weight < 1:
+            return None
+        for other,other_weight in out_list:
+            if other == region:
+                return None
+        out_list.append( (region,weight) )
+    if len(out_list) == 0:
+        return None
+    return out_list
+
+def assign_regions(region_weights,count):
+    '''list of count regions, one per machine, spread by weight. Uses smooth
+    weighted round robin, so a series is interleaved, nyc1,sfo3,nyc1, instead
+    of in blocks'''
+    total    = 0
+    current  = {}
+    for region,weight in region_weights:
+        total += weight
+        current[region] = 0
+    out_list = []
+    for i in range(count):
+        for region,weight in region_weights:
+            current[region] += weight
+        pick = region_weights[0][0]
+        for region,weight in region_weights:
+            if current[region] > current[pick]:
+                pick = region
+        current[pick] -= total
+        out_list.append(pick)
+    return out_list
+
+def check_template_regions(loaded_config,manager,regions):
+    '''preflight for spawn, exit if the template is not in every region we
+    spawn in. Images can't be used outside of the regions they are in'''
+    try:
+        template_id = int(loaded_config['template'])
+    except ValueError:
+        exit_with_error(2,"spawn: template must be the number ID of a custom image, see list templates")
+    use_image = None
+    for refresh in (False,True):
+        for image in get_catalog(loaded_config,manager,"images",refresh):
+            if image.id == template_id:
+                use_image = image
+        if use_image != None:
+            break
+    if use_image == None:
+        warn("spawn: template " + str(template_id) + " is not in list templates, can't check its regions")
+        return
+    missing = []
+    for region in regions:
+        if region not in use_image.regions:
+            missing.append(region)
+    if len(missing) >= 1:
+        exit_with_error(2,"spawn: template " + str(template_id) + " is not available in region(s): " + ", ".join(missing) + ". It is in: " + ", ".join(use_image.regions))
+
+def get_ssh_key_obj(loaded_config,manager):
+    '''Return the SSH key object for ssh-key-n from the config'''
+    key_n   = loaded_config['ssh-key-n']
+    try:
+        all_ssh_keys = get_catalog(loaded_config,manager,"ssh-keys")
+        if key_n >= len(all_ssh_keys):
+            all_ssh_keys = get_catalog(loaded_config,manager,"ssh-keys",refresh=True)
+    except digitalocean.DataReadError:
+        exit_with_error(1,"spawn: DataReadError, check settings and try again")
+    if key_n >= len(all_ssh_keys):
+        exit_with_error(2,"spawn: ssh-key-n " + str(key_n) + " is out of range, see list ssh-keys")
+    return all_ssh_keys[key_n]
+
+def get_project_obj(loaded_config,manager):
+    '''Take the text entry on project from config and return the project
+    object, or None if there is no project by that name'''
+    # try the cache first, and the API if its not there, it might be new
+    for refresh in (False,True):
+        try:
+            projects = get_catalog(loaded_config,manager,"projects",refresh)
+        except digitalocean.DataReadError:
+            exit_with_error(1,"spawn: DataReadError, check settings and try again")
         for item in projects:
             if item.name == loaded_config['project']:
-                use_project = item
-        if use_project == None:
-            warn_line = "spawn: could not add " + machine_name + " to non-existant project: " + loaded_config['project'] + ", skipping"
-            warn("spawn: could not add " + machine_name + " to non-existant project: " + loaded_config['project'] + ", skipping")
-            return
-        droplet_add_string = "do:droplet:" + str(new_vm.id)
+                return item
+    return None
+
+def assign_to_project(loaded_config,use_project,new_vms):
+    '''Add a list of new droplets to a project object, max_project_assign
+    droplets per API call. returns count of droplets that could not be added'''
+    fails = 0
+    for i in range(0,len(new_vms),max_project_assign):
+        chunk = new_vms[i:i + max_project_assign]
+        droplet_add_strings = []
+        for new_vm in chunk:
+            droplet_add_strings.append("do:droplet:" + str(new_vm.id))
         try:
-            use_project.assign_resource([droplet_add_string])
+            api_post(loaded_config,"projects/" + use_project.id + "/resources",{"resources":droplet_add_strings})
         except:
-            warn_line = "Could not add %s to project \'%s\'. Check perms on API Key" %(machine_name,loaded_config['project'])
+            machine_names = []
+            for new_vm in chunk:
+                machine_names.append(new_vm.name)
+            warn_line = "Could not add %s to project \'%s\'. Check perms on API Key" %(",".join(machine_names),loaded_config['project'])
             warn(warn_line)
-    # return VM for use in array later
-    return new_vm
+            fails += len(chunk)
+    return fails
 
 def create_subdomain(loaded_config,hostname,ip_address):
     '''Update DNS for new virtual machine, assumes domain is valid, check first'''
-    api_key     = loaded_config['api-key']
     domain_name = loaded_config['domain']
-    domain_obj  = digitalocean.Domain(token=api_key, name=domain_name)
     dns_ttl     = 360 # we set this LOW because this is very dynamic
     
-    new_record  = domain_obj.create_new_domain_record(type="A", name=hostname, data=ip_address, ttl=dns_ttl)
+    record_data = {"type":"A", "name":hostname, "data":ip_address, "ttl":dns_ttl}
+    new_record  = api_post(loaded_config,"domains/" + domain_name + "/records",record_data)
     return new_record
     
-def update_subdomain(loaded_config,hostname,ip_address):
-    '''Update an existing DNS entry, if it previously exists'''
+def update_subdomain(loaded_config,entry_id,ip_address):
+    '''Update an existing DNS entry, by its DO record id. see get_dns_index'''
     api_key     = loaded_config['api-key']
     domain_name = loaded_config['domain']
-    domain_obj  = digitalocean.Domain(token=api_key, name=domain_name)
-        
-    # Get the DO identifier for the record.
-    entry_id       = None
-    domain_entries = domain_obj.get_records()
-    
-    for item in domain_entries:
-        if item.name == hostname:
-            entry_id = item.id
-    if entry_id == None:
-        raise digitalocean.NotFoundError("Update DNS: Could not find DNS entry")
+    domain_obj  = digitalocean.Domain(token=api_key, name=domain_name, _session=api_session)
 
     updated_record = domain_obj.update_domain_record(id=entry_id, domain=domain_name, data=ip_address)
     return updated_record
     
-def remove_subdomain(loaded_config,hostname):
-    '''Remove subdomain from DNS. Use with entry'''
+def remove_subdomain(loaded_config,entry_id):
+    '''Remove subdomain from DNS, by its DO record id. see get_dns_index'''
     api_key     = loaded_config['api-key']
     domain_name = loaded_config['domain']
-    domain_obj  = digitalocean.Domain(token=api_key, name=domain_name)
-    hostname    = hostname.split(".")[0]
-    entry_id       = None
-    domain_entries = domain_obj.get_records()
-    for item in domain_entries:
-        if item.name == hostname:
-            entry_id = item.id
-    if entry_id == None:
-        raise digitalocean.NotFoundError("Remove DNS: Could not find DNS entry")
-
-    domain_obj.delete_domain_record(id=entry_id, domain=domain_name)
+    domain_obj  = digitalocean.Domain(token=api_key, name=domain_name, _session=api_session)
+
+    try:
+        domain_obj.delete_domain_record(id=entry_id, domain=domain_name)
+    except digitalocean.NotFoundError:
+        # already gone, i.e. stale record id from the inventory
+        pass
     return
 
-def spawn_machines(loaded_config,N=1,terse=False):
-    '''the spawn command. takes the config dict and N, int number of machines'''
+def reconcile_dns(loaded_config,dns_index,wanted={},remove=[],record_ids=None):
+    '''Bring DNS in line for a whole series at once. dns_index is from
+    get_dns_index. wanted is a dict of hostname:ip_address that should have an
+    A-record, remove is a list of hostnames that should not. Works out what to
+    create, update and delete against the index, then does it in parallel.
+    returns a dict of hostname:warning for everything that failed. If
+    record_ids is a dict, it gets hostname:record id for every wanted record'''
+    changes = []
+    failed  = {}
+    for hostname in wanted:
+        ip_address = wanted[hostname]
+        if ip_address == None:
+            failed[hostname] = "Could not set DNS for " + hostname + ", no IP address"
+        elif hostname not in dns_index:
+            changes.append( (hostname,create_subdomain,hostname,"Could not set DNS for ") )
+        elif dns_index[hostname].data != ip_address:
+            changes.append( (hostname,update_subdomain,dns_index[hostname].id,"Could not set DNS for ") )
+        if record_ids != None and hostname in dns_index:
+            record_ids[hostname] = dns_index[hostname].id
+    for hostname in remove:
+        if hostname not in dns_index:
+            failed[hostname] = "No DNS for entry:" + hostname
+        else:
+            changes.append( (hostname,remove_subdomain,dns_index[hostname].id,"Could not remove DNS entry for ") )
+
+    if len(changes) == 0:
+        return failed
+    workers = min(loaded_config['parallel'],len(changes))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for hostname,change,target,warn_line in changes:
+            if change == remove_subdomain:
+                futures.append(pool.submit(change,loaded_config,target))
+            else:
+                futures.append(pool.submit(change,loaded_config,target,wanted[hostname]))
+        for i in range(len(changes)):
+            hostname,change,target,warn_line = changes[i]
+            try:
+                reply = futures[i].result()
+            except:
+                failed[hostname] = warn_line + hostname
+                continue
+            if record_ids != None and change == create_subdomain:
+                record_ids[hostname] = reply['domain_record']['id']
+    return failed
+
+def wait_for_ips(loaded_config,manager,machine_list):
+    '''Wait until every droplet in machine_list has a public IP address. The
+    whole series is refreshed with one tag filtered list call per tick, backing
+    off between calls, with one deadline for all of it. Updates the droplet
+    objects in place, and returns a list of the ones that timed out'''
+    tick     = 1   # first wait between checks, in seconds, doubles every check
+    max_tick = 10  # longest wait between checks
+    timeout  = 300 # seconds before we giveup. Generally these take a min before we get an IP.
+    deadline = time.time() + timeout
+
+    pending = {}
+    for machine in machine_list:
+        if machine.ip_address == None:
+            pending[machine.id] = machine
+
+    while len(pending) >= 1:
+        try:
+            tagged_list = manager.get_all_droplets(tag_name=loaded_config['tag'])
+        except:
+            tagged_list = []
+            warn("spawn: could not get list of machines while waiting for IPs, retrying")
+        for droplet in tagged_list:
+            if droplet.id not in pending or droplet.ip_address == None:
+                continue
+            machine = pending.pop(droplet.id)
+            machine.ip_address         = droplet.ip_address
+            machine.private_ip_address = droplet.private_ip_address
+            machine.ip_v6_address      = droplet.ip_v6_address
+            machine.networks           = droplet.networks
+            machine.status             = droplet.status
+        if len(pending) == 0:
+            break
+        time_left = deadline - time.time()
+        if time_left <= 0:
+            for machine in pending.values():
+                warn("Timeout reached waiting for IP for: " + machine.name)
+            break
+        time.sleep(min(tick,time_left))
+        tick = min(tick * 2,max_tick)
+
+    return list(pending.values())
+
+def encode_payload(payload_bytes,encoding):
+    '''payload as a string for user-data, in encoding, see payload_encodings'''
+    if encoding == "gzip+base64":
+        import gzip,base64
+        # mtime 0, so the same payload encodes the same every time
+        return base64.b64encode(gzip.compress(payload_bytes,mtime=0)).decode()
+    return payload_bytes.decode()
+
+def load_payload(loaded_config):
+    '''payload config item to what goes in user-data. returns payload,
+    payload-filename and payload-encoding. FILE: payloads are read from disk'''
+    encoding = loaded_config['payload-encoding']
+    if encoding not in payload_encodings:
+        exit_with_error(2,"spawn: payload-encoding must be one of: " + ", ".join(payload_encodings))
+    if loaded_config['payload'].startswith("FILE:") == False:
+        return encode_payload(loaded_config['payload'].encode(),encoding),"",encoding
+    # get filename as everythinng after first ':'
+    file_name = loaded_config['payload'].split(":")[1:]
+    file_name = " ".join(file_name)
+    try:
+        file_obj = open(file_name,"rb")
+        file_data = file_obj.read()
+        file_obj.close()
+    except:
+        error_line = "spawn: could not read payload from %s. Please ensure this file exists and read permissions are set" % (file_name)
+        exit_with_error(2,error_line)
+    if encoding == "none":
+        try:
+            file_data.decode()
+        except UnicodeDecodeError:
+            exit_with_error(2,"spawn: payload " + file_name + " is not text, use --payload-encoding gzip+base64 for binary files")
+    return encode_payload(file_data,encoding),os.path.basename(file_name),encoding
+
+class user_data_template:
+    '''user-data for one spawn. The fields every machine shares, such as the
+    payload, are made into compact JSON once, and render() only turns the per
+    machine fields into JSON and puts them in front'''
+    separators = (",",":")
+
+    def __init__(self,common_meta):
+        # everything after the opening brace, i.e. "base-name":"web",...}
+        self.tail      = json.dumps(common_meta,separators=self.separators)[1:]
+        self.tail_size = len(self.tail.encode())
+
+    def head(self,machine_meta):
+        head = json.dumps(machine_meta,separators=self.separators)[:-1]
+        if self.tail != "}":
+            head += ","
+        return head
+
+    def render(self,machine_meta):
+        '''user-data string for a machine, or a multi-create batch'''
+        return self.head(machine_meta) + self.tail
+
+    def size(self,machine_meta):
+        '''bytes render() would return, without making it'''
+        return len(self.head(machine_meta).encode()) + self.tail_size
+
+class payload_shard:
+    '''one droplet's part of a sharded payload. Takes bytes a piece at a time,
+    and if the payload is gzipped, keeps only the gzipped bytes, so no more
+    than what goes in user-data is held in memory. Exits as soon as it can't
+    fit in user-data'''
+    def __init__(self,name,encoding):
+        self.name     = name
+        self.encoding = encoding
+        self.chunks   = []
+        self.size     = 0
+        self.compress = None
+        if encoding == "gzip+base64":
+            import zlib
+            # wbits 31 is a gzip header, same as gzip.compress
+            self.compress = zlib.compressobj(9,zlib.DEFLATED,31)
+
+    def write(self,data):
+        if self.compress != None:
+            data = self.compress.compress(data)
+        self.chunks.append(data)
+        self.size += len(data)
+        size = self.size
+        if self.encoding != "none":
+            size = size * 4 // 3
+        if size > max_user_data:
+            error_line = "spawn: " + self.name + " is over " + str(max_user_data) + " bytes, too big for user-data. Use more machines"
+            if self.encoding == "none":
+                error_line += ", or --payload-encoding gzip+base64"
+            exit_with_error(2,error_line)
+        return len(data)
+
+    def finish(self):
+        '''the shard as a string for user-data'''
+        if self.compress != None:
+            self.chunks.append(self.compress.flush())
+        data = b"".join(self.chunks)
+        if self.encoding == "none":
+            try:
+                return data.decode()
+            except UnicodeDecodeError:
+                exit_with_error(2,"spawn: " + self.name + " is not text, use --payload-encoding gzip+base64")
+        import base64
+        return base64.b64encode(data).decode()
+
+def shard_start(total,N,shard):
+    '''first item of shard out of N, when total items are split as evenly as
+    they go. shard N is the end'''
+    return total * shard // N
+
+def shard_payload(loaded_config,N,sequence_list):
+    '''split the FILE: payload in N by payload-shard, and return shards as a
+    dict of sequence:payload, payload-filename, and payload-encoding. Only
+    shards in sequence_list are made. lines and bytes read the file as a
+    stream, files packs each shard of a directory as a tar.gz'''
+    mode     = loaded_config['payload-shard']
+    encoding = loaded_config['payload-encoding']
+    if encoding not in payload_encodings:
+        exit_with_error(2,"spawn: payload-encoding must be one of: " + ", ".join(payload_encodings))
+    if loaded_config['payload'].startswith("FILE:") == False:
+        exit_with_error(2,"spawn: payload-shard needs a FILE: payload to split")
+    # get filename as everythinng after first ':'
+    file_name = loaded_config['payload'].split(":")[1:]
+    file_name = " ".join(file_name)
+    wanted    = set(sequence_list)
+    shards    = {}
+
+    if mode == "files":
+        if os.path.isdir(file_name) == False:
+            exit_with_error(2,"spawn: payload-shard files needs a directory, " + file_name + " is not one")
+        import tarfile
+        file_list = []
+        for root,dirs,files in os.walk(file_name):
+            dirs.sort()
+            for item in sorted(files):
+                file_list.append(os.path.join(root,item))
+        for i in wanted:
+            shard = payload_shard("payload shard " + str(i),"tar+gzip+base64")
+            # stream mode, only needs write() on the shard
+            tar_obj = tarfile.open(fileobj=shard,mode="w|gz")
+            for path in file_list[shard_start(len(file_list),N,i):shard_start(len(file_list),N,i + 1)]:
+                try:
+                    tar_obj.add(path,arcname=os.path.relpath(path,file_name))
+                except OSError:
+                    exit_with_error(2,"spawn: could not read payload file " + path)
+            tar_obj.close()
+            shards[i] = shard.finish()
+        return shards,os.path.basename(os.path.normpath(file_name)),"tar+gzip+base64"
+
+    if os.path.isfile(file_name) == False:
+        exit_with_error(2,"spawn: could not read payload from %s. Please ensure this file exists and read permissions are set" % (file_name))
+    for i in wanted:
+        shards[i] = payload_shard("payload shard " + str(i),encoding)
+    try:
+        if mode == "lines":
+            # count first, so shards are even and in file order
+            total = 0
+            file_obj = open(file_name,"rb")
+            for line in file_obj:
+                total += 1
+            file_obj.seek(0)
+            shard = 0
+            line_n = 0
+            for line in file_obj:
+                while line_n >= shard_start(total,N,shard + 1):
+                    shard += 1
+                if shard in wanted:
+                    shards[shard].write(line)
+                line_n += 1
+            file_obj.close()
+        elif mode == "bytes":
+            total = os.path.getsize(file_name)
+            file_obj = open(file_name,"rb")
+            for i in wanted:
+                file_obj.seek(shard_start(total,N,i))
+                left = shard_start(total,N,i + 1) - shard_start(total,N,i)
+                while left > 0:
+                    data = file_obj.read(min(left,65536))
+                    if data == b"":
+                        break
+                    shards[i].write(data)
+                    left -= len(data)
+            file_obj.close()
+    except OSError:
+        exit_with_error(2,"spawn: could not read payload from %s. Please ensure this file exists and read permissions are set" % (file_name))
+    for i in wanted:
+        shards[i] = shards[i].finish()
+    return shards,os.path.basename(file_name),encoding
+
+def spawn_machines(loaded_config,N=1,terse=False,sequence_list=None,expires=None,finish=True):
+    '''the spawn command. takes the config dict and N, int number of machines.
+    sequence_list is for scale, only make these sequence numbers out of N. With
+    finish False, return the number of failures instead of exiting'''
     
     manager = check_and_connect(loaded_config)
     
@@ -601,90 +2006,188 @@ def spawn_machines(loaded_config,N=1,terse=False):
         N = int(N)
     except:
         exit_with_error(2,"spawn: N needs to be an interger")
-    # Get ssh keys
-    try:
-        all_ssh_keys = manager.get_all_sshkeys()
-    except digitalocean.DataReadError:
-        exit_with_error(1,"spawn: DataReadError, check settings and try again")
-    key_n   = loaded_config['ssh-key-n']
-    use_key = all_ssh_keys[key_n]
-    
-    if loaded_config['domain'] != "" and check_domain_exists(loaded_config) == False:
-        exit_with_error(9,"spawn: domain is set, but domain name is not in Digital Ocean account, stop!")
-
-    # Load payload from file, if applicable
-    meta_payload  = ""
-    meta_filename = ""
-    if loaded_config['payload'].startswith("FILE:") == True:
-        # get filename as everythinng after first ':'
-        meta_filename = loaded_config['payload'].split(":")[1:]
-        meta_filename = " ".join(meta_filename)
-        try:
-            file_obj = open(meta_filename,"r")
-            file_data = file_obj.read()
-            file_obj.close()
-            meta_payload = file_data
-        except:
-            error_line = "spawn: could not read payload from %s. Please ensure this file exists and read permissions are set" % (meta_filename)
-            exit_with_error(2,error_line)
+    if type(loaded_config['parallel']) != int or loaded_config['parallel'] < 1:
+        exit_with_error(2,"spawn: parallel needs to be an interger of at least 1")
+    region_weights = parse_regions(loaded_config['region'])
+    if region_weights == None:
+        exit_with_error(2,"spawn: can't read region " + loaded_config['region'] + ", use a region, a list like nyc1,sfo3, or weights like nyc1:2,sfo3:1")
+
+    if sequence_list == None:
+        sequence_list = list(range(N))
+        banner = "Spawning machine series: %s, %s machines(s)" % (loaded_config['base-name'],str(N))
     else:
-        meta_payload = loaded_config['payload']
-    
-    banner = "Spawning machine series: %s, %s machines(s)" % (loaded_config['base-name'],str(N))
-    if terse == False:
-        message(banner)
-    # spawn N machines
+        banner = "Growing machine series: %s to %s machine(s), %s new" % (loaded_config['base-name'],str(N),str(len(sequence_list)))
+
+    # With payload-shard, every droplet gets its own part of the payload
+    shard_mode = loaded_config['payload-shard']
+    if shard_mode not in payload_shard_modes:
+        exit_with_error(2,"spawn: payload-shard must be one of: " + ", ".join(payload_shard_modes))
+    if shard_mode == "none":
+        meta_payload,meta_filename,meta_encoding = load_payload(loaded_config)
+    else:
+        shards,meta_filename,meta_encoding = shard_payload(loaded_config,N,sequence_list)
+    vm_tags = [ loaded_config['tag'] ]
+    if expires != None:
+        vm_tags.append(expire_tag_prefix + str(expires))
+        banner += ", expiring " + datetime.fromtimestamp(expires).strftime("%Y-%m-%d %H:%M:%S")
+    # spawn N machines. Names and user-data are worked out in sequence order,
+    # the create calls then go out in parallel, up to the parallel setting.
     fails = 0
-    meta_filename = os.path.basename(meta_filename)
     machine_list = []
-    for i in range(N):
-        user_meta = { 
-        "sequence" : int(i),
-        "total_vms": int(N),
-        "base-name":loaded_config['base-name'],
-        "domain":loaded_config['domain'],
-        "payload":meta_payload,
-        "payload-filename":meta_filename,
-        }
-        user_meta = json.dumps(user_meta,indent=2)
+    create_jobs  = []
+    vm_names     = []
+    for i in sequence_list:
         # If there is only one machine in sequence, then don't add a number
         # This is so you can use some whacky vhosts
-        if N == 1:
+        if N == 1 and len(sequence_list) == 1:
             vm_name   = loaded_config['base-name']
         else:
             vm_name   = loaded_config['base-name'] + str(i)
             
         if loaded_config['domain'] != '':
             vm_name += "." + loaded_config['domain']
-        msg_line  = vm_name + " created"
-        try:
-            new_machine = create_machine(loaded_config,vm_name,use_key,user_meta)
-            if new_machine != None:
-                machine_list.append(new_machine)
-            if terse == False:
-                submsg(msg_line)
-        except: #DEBUG
-            warn("spawn: could not create machine " + vm_name)
-            fails += 1
-    
+        vm_names.append(vm_name)
+
+    # Spread the series over the regions by weight
+    vm_regions = assign_regions(region_weights,len(vm_names))
+    region_positions = {}
+    for i in range(len(vm_names)):
+        if vm_regions[i] not in region_positions:
+            region_positions[vm_regions[i]] = []
+        region_positions[vm_regions[i]].append(i)
+
+    # With multi-create, up to max_multi_create machines in the same region go
+    # out in one API call. They all share one user-data, so sequence is null
+    # and each droplet looks up its own sequence number by hostname in
+    # sequence-map.
+    use_multi = loaded_config['multi-create']
+    if use_multi == True and shard_mode != "none":
+        warn("spawn: sharded payloads need one user-data per droplet, not using multi-create")
+        use_multi = False
+    if use_multi == True:
+        batch_size = max_multi_create
+    else:
+        batch_size = 1
+    # What is the same for every machine, payload included, is turned into
+    # JSON once. Jobs only keep the few fields that differ, and user-data is
+    # put together as each create goes out
+    common_meta = {
+    "total_vms": int(N),
+    "base-name":loaded_config['base-name'],
+    "domain":loaded_config['domain'],
+    "expires":expires,
+    "payload-filename":meta_filename,
+    "payload-encoding":meta_encoding,
+    "payload-shard":shard_mode,
+    }
+    if shard_mode == "none":
+        common_meta['payload'] = meta_payload
+    # where to send results, see collect
+    if loaded_config['collect-url'] != "":
+        common_meta['collect-url']   = get_collect_url(loaded_config)
+        common_meta['collect-token'] = get_collect_token(loaded_config)
+    meta_template = user_data_template(common_meta)
+    for region in region_positions:
+        positions = region_positions[region]
+        for i in range(0,len(positions),batch_size):
+            batch_positions = positions[i:i + batch_size]
+            batch_names     = [vm_names[j] for j in batch_positions]
+            machine_meta = { 
+            "sequence" : sequence_list[batch_positions[0]],
+            "region":region,
+            }
+            if shard_mode != "none":
+                machine_meta['payload'] = shards[machine_meta['sequence']]
+            if use_multi == True:
+                machine_meta['sequence']     = None
+                machine_meta['sequence-map'] = {}
+                for j in batch_positions:
+                    machine_meta['sequence-map'][vm_names[j]] = sequence_list[j]
+            create_jobs.append( (batch_names,machine_meta,region) )
+
+    # Digital Ocean turns away user-data over 64KiB, one droplet at a time.
+    # Find out now, before anything is made
+    largest = 0
+    for batch_names,machine_meta,region in create_jobs:
+        largest = max(largest,meta_template.size(machine_meta))
+    if largest > max_user_data:
+        error_line = "spawn: user-data is " + str(largest) + " bytes, Digital Ocean allows " + str(max_user_data) + ". Make the payload smaller"
+        if meta_encoding == "none":
+            error_line += ", or try --payload-encoding gzip+base64"
+        exit_with_error(2,error_line)
+
+    if terse == False:
+        message(banner)
+    # ssh key, domain, project and template lookups don't depend on each other,
+    # do them at the same time. Project is looked up once, all new machines get
+    # added at the end
+    use_project  = None
+    use_domain   = loaded_config['domain'] != ""
+    with_project = loaded_config['project'] != None and loaded_config['project'] != ""
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        key_future      = pool.submit(get_ssh_key_obj,loaded_config,manager)
+        template_future = pool.submit(check_template_regions,loaded_config,manager,[region for region,weight in region_weights])
+        if use_domain == True:
+            domain_future  = pool.submit(check_domain_exists,loaded_config)
+        if with_project == True:
+            project_future = pool.submit(get_project_obj,loaded_config,manager)
+        use_key = key_future.result()
+        template_future.result()
+        if use_domain == True and domain_future.result() == False:
+            exit_with_error(9,"spawn: domain is set, but domain name is not in Digital Ocean account, stop!")
+        if with_project == True:
+            use_project = project_future.result()
+            if use_project == None:
+                warn("spawn: project " + loaded_config['project'] + " does not exist, machines will not be added to a project")
+
+    def create_job(batch_names,machine_meta,region):
+        '''user-data is made here, in the worker, so only the creates in
+        flight hold a copy of it'''
+        user_meta = meta_template.render(machine_meta)
+        if use_multi == True:
+            return create_machines(loaded_config,batch_names,use_key,user_meta,region,vm_tags)
+        return create_machine(loaded_config,batch_names[0],use_key,user_meta,region,vm_tags)
+
+    workers = min(loaded_config['parallel'],len(create_jobs))
+    with ThreadPoolExecutor(max_workers=max(workers,1)) as pool:
+        futures = []
+        for batch_names,machine_meta,region in create_jobs:
+            futures.append(pool.submit(create_job,batch_names,machine_meta,region))
+        # collect in job order. Jobs are grouped by region, so "created" lines
+        # print in region order, and machine_list is sorted after
+        for i in range(len(create_jobs)):
+            batch_names = create_jobs[i][0]
+            try:
+                new_machines = futures[i].result()
+                if type(new_machines) == list:
+                    machine_list += new_machines
+                else:
+                    machine_list.append(new_machines)
+                if terse == False:
+                    for vm_name in batch_names:
+                        submsg(vm_name + " created")
+            except: #DEBUG
+                for vm_name in batch_names:
+                    warn("spawn: could not create machine " + vm_name)
+                    fails += 1
+    # jobs went out by region, put machines back in sequence order
+    name_position = {}
+    for i in range(len(vm_names)):
+        name_position[vm_names[i]] = i
+    machine_list.sort(key=lambda machine: name_position.get(machine.name,0))
+
+    # Add everything we made to the project, in as few calls as we can
+    if use_project != None and len(machine_list) >= 1:
+        fails += assign_to_project(loaded_config,use_project,machine_list)
+
     ## wait for IP addresses.
-    tick    = 1 #period to check for an IP address, measured in seconds
-    timeout = 300 # ticks before we giveup. Generally these take a min before we get an IP.
-    tab_space = 20
+    tab_space  = 20
+    record_ids = {}
     #If not using DNS and waiting for IP addresses
     if loaded_config['wait'] == True and loaded_config['domain'] == "" and len(machine_list) >= 1:
         if terse == False:
             message("Waiting for IP Address(es)...")
-        for machine in machine_list:
-            timer = 0
-            machine = machine.load()
-            while machine.ip_address == None:
-                machine = machine.load()
-                timer  += 1
-                time.sleep(tick)
-                if timer > timeout:
-                    warn("Timeout reached waiting for IP for: " + machine.name)
-                    break
+        wait_for_ips(loaded_config,manager,machine_list)
         # Now print IP address table        
         out_line  = colors.bold + "Machine\tIP Address".expandtabs(tab_space) + colors.reset
         out_line  = out_line.expandtabs(tab_space)
@@ -692,7 +2195,6 @@ def spawn_machines(loaded_config,N=1,terse=False):
         if terse == False:
             print(out_line)
         for machine in machine_list:
-            machine  = machine.load()
             out_line = machine.name + "\t" + str(machine.ip_address)
             out_line = out_line.expandtabs(tab_space)
             if terse == False:
@@ -711,28 +2213,25 @@ def spawn_machines(loaded_config,N=1,terse=False):
     elif loaded_config['domain'] != "" and len(machine_list) >= 1:
         if terse == False:
             message("Waiting for IP Address(es) before adding DNS entries")
-        for machine in machine_list:
-            timer = 0
-            machine = machine.load()
-            while machine.ip_address == None:
-                machine = machine.load()
-                timer  += 1
-                time.sleep(tick)
-                if timer > timeout:
-                    warn("Timeout reached waiting for IP for: " + machine.name)
-                    break
+        wait_for_ips(loaded_config,manager,machine_list)
         # Add DNS. Add new entry if not found, update if found
         banner_line = colors.bold + "Machine\tIP Address" + colors.reset
         banner_line = banner_line.expandtabs(tab_space)
         out_lines = []
+        wanted    = {}
         for machine in machine_list:
             dns_entry = machine.name.split('.')[0]
-            try:
-                if check_subdomain_exists(loaded_config,dns_entry) == True:
-                    update_subdomain(loaded_config,dns_entry,machine.ip_address)
-                else:
-                    create_subdomain(loaded_config,dns_entry,machine.ip_address)
-            except:
+            wanted[dns_entry] = machine.ip_address
+        try:
+            dns_index  = get_dns_index(loaded_config)
+            dns_failed = reconcile_dns(loaded_config,dns_index,wanted=wanted,record_ids=record_ids)
+        except:
+            dns_failed = {}
+            for dns_entry in wanted:
+                dns_failed[dns_entry] = "Could not set DNS for " + dns_entry
+        for machine in machine_list:
+            dns_entry = machine.name.split('.')[0]
+            if dns_entry in dns_failed:
                 warn("Could not set DNS for " + machine.name)
             else:
                 if terse == False:
@@ -755,7 +2254,16 @@ def spawn_machines(loaded_config,N=1,terse=False):
         else:
             warn("spawn: print dns ip table: terse neither True nor False, should not be! Debug!")
 
+    # Remember what we made, so destroy can go straight to it
+    if len(machine_list) >= 1:
+        sequence_map = {}
+        for i in range(len(vm_names)):
+            sequence_map[vm_names[i]] = sequence_list[i]
+        inventory_add(loaded_config,machine_list,sequence_map,record_ids)
+
     # Clean up and exit
+    if finish == False:
+        return fails
     if fails >= 1 and len(machine_list) == 0:
         if terse == False:
             message("No Machines spawned, " + str(fails) + " failure(s)" )
@@ -769,60 +2277,212 @@ def spawn_machines(loaded_config,N=1,terse=False):
             message("Done")
         sys.exit(0)
 
-def destroy_machines(loaded_config,args=[],terse=False):
-    '''delete virtual machine(s). Deletes machines specified by a list
-    of matching machine names. If ALL is specified instead of a list
-    all machines with the configured tag will be deleted'''
+def destroy_by_tag(manager,tag):
+    '''Destroy every droplet with tag in one API call'''
+    # python-digitalocean has no call for this, DELETE /v2/droplets?tag_name=
+    return manager.get_data("droplets?tag_name=" + urllib.parse.quote(tag), type=digitalocean.baseapi.DELETE)
+
+def destroy_machine(machine):
+    '''destroy one droplet. One that is already gone counts as destroyed'''
+    try:
+        machine.destroy()
+    except digitalocean.NotFoundError:
+        pass
+
+def destroy_machine_list(loaded_config,delete_machines,terse=False):
+    '''destroy droplets in parallel, up to the parallel setting. returns
+    names destroyed, ids destroyed, and number of failures'''
+    destroyed_list = []
+    destroyed_ids  = []
+    fails          = 0
+    if len(delete_machines) == 0:
+        return destroyed_list,destroyed_ids,fails
+    workers = min(loaded_config['parallel'],len(delete_machines))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for item in delete_machines:
+            futures.append(pool.submit(destroy_machine,item))
+        for i in range(len(delete_machines)):
+            item = delete_machines[i]
+            try:
+                futures[i].result()
+                if terse == False:
+                    submsg(item.name + " destroyed")
+            except:
+                warn("Could not destroy" + item.name)
+                fails += 1
+            else:
+                destroyed_list.append(item.name)
+                destroyed_ids.append(item.id)
+    return destroyed_list,destroyed_ids,fails
+
+def remove_machine_dns(loaded_config,destroyed_list,dns_known={},terse=False):
+    '''remove A-records in the config domain for destroyed machine names.
+    dns_known is hostname:Record from the inventory, the domain is only listed
+    if it is missing any. returns number of failures'''
+    fails = 0
+    if terse == False:
+        submsg("[+]-Removing DNS")
+    remove_list = []
+    for name in destroyed_list:
+        remove_list.append(name.split(".")[0])
+    try:
+        # Only list the domain if the inventory doesn't know every record
+        dns_index = dns_known
+        for hostname in remove_list:
+            if hostname not in dns_known:
+                dns_index = get_dns_index(loaded_config)
+                break
+        dns_failed = reconcile_dns(loaded_config,dns_index,remove=remove_list)
+    except:
+        dns_failed = {}
+        for hostname in remove_list:
+            dns_failed[hostname] = "Could not remove DNS entry for " + hostname
+    for hostname in remove_list:
+        if hostname in dns_failed:
+            warn(dns_failed[hostname])
+            fails += 1
+    return fails
+
+def get_sequence(hostname,base_name):
+    '''sequence number of hostname in the base_name series, or None if it is
+    not in the series. A lone machine named just base_name is sequence 0'''
+    if hostname == base_name:
+        return 0
+    suffix = hostname[len(base_name):]
+    if hostname.startswith(base_name) and suffix.isdigit():
+        return int(suffix)
+    return None
+
+def parse_series_range(item):
+    '''destroy argument to (base-name,first,last). base-name[first-last] or
+    base-name[n] picks sequence numbers, a plain base-name has first and last
+    of None, and matches every name starting with it'''
+    if "[" not in item:
+        return (item,None,None)
+    if item.endswith("]") == False:
+        exit_with_error(2,"destroy: bad range " + item + ", use base-name[first-last]")
+    base_name,seq_range = item[:-1].split("[",1)
+    seq_range = seq_range.split("-")
+    try:
+        first = int(seq_range[0])
+        last  = int(seq_range[-1])
+    except ValueError:
+        exit_with_error(2,"destroy: bad range " + item + ", use base-name[first-last]")
+    if len(seq_range) > 2 or base_name == "" or first > last:
+        exit_with_error(2,"destroy: bad range " + item + ", use base-name[first-last]")
+    return (base_name,first,last)
+
+def series_match(machine_name,selectors):
+    '''True if machine_name is picked by any of selectors from parse_series_range'''
+    hostname = machine_name.split(".")[0]
+    for base_name,first,last in selectors:
+        if first == None:
+            if machine_name.startswith(base_name):
+                return True
+        else:
+            sequence = get_sequence(hostname,base_name)
+            if sequence != None and first <= sequence <= last:
+                return True
+    return False
+
+def destroy_machines(loaded_config,args=[],terse=False,finish=True,use_inventory=True):
+    '''delete virtual machine(s). Deletes machines in one or more series, args
+    is a list of base-names, if blank use base-name from config. A base-name can
+    have a range of sequence numbers, i.e. web[10-49]. If ALL is specified
+    instead of a list all machines with the configured tag will be deleted.
+    With finish False, return the number of failures instead of exiting.
+    Droplets always come from one listing of the tag, so machines spawned
+    elsewhere are not missed. The inventory only saves listing DNS, unless
+    use_inventory is False'''
 
     manager   = check_and_connect(loaded_config)
     vm_tag    = loaded_config['tag']
-    base_name = loaded_config['base-name']
+    selectors = []
+    for item in args:
+        if item != "ALL" and item != "":
+            selectors.append(parse_series_range(item))
+    if len(selectors) == 0:
+        selectors = [ (loaded_config['base-name'],None,None) ]
+    base_names = []
+    for base_name,first,last in selectors:
+        if first == None:
+            base_names.append(base_name)
+        else:
+            base_names.append(base_name + "[" + str(first) + "-" + str(last) + "]")
     
-    # get a list of machines to delete
+    # get a list of machines to delete. Always from the API, the inventory
+    # only knows what was spawned from here
     try:
-        running_machine_list = manager.get_all_droplets(tag_name=vm_tag)
+        running_machine_list = use_session(manager.get_all_droplets(tag_name=vm_tag))
     except:
         exit_with_error(1,"destroy: could NOT get list of machines, exiting")
-    
+
     # Sort out what needs to be deleted
-    delete_machines     = []
+    delete_machines = []
     if "ALL" in args:
         delete_machines = running_machine_list
         N = len(delete_machines)
         banner = "Destroying ALL Machines. Count: " + str(N) + " machine(s)"
     else:
         for item in running_machine_list:
-            if item.name.startswith(base_name):
+            if series_match(item.name,selectors) == True:
                 delete_machines.append(item)
         N      = len(delete_machines)
-        banner = "Destroying machine series: " + base_name + ", " + str(N) + " machine(s)"
+        banner = "Destroying machine series: " + ", ".join(base_names) + ", " + str(N) + " machine(s)"
+
+    # DNS record ids for series spawned from here are in the inventory, so
+    # the domain only needs listing for machines that are not. Rows for
+    # droplets that are already gone are dropped
+    dns_known = {}
+    if "ALL" not in args and use_inventory == True:
+        running_ids = set()
+        for item in delete_machines:
+            running_ids.add(item.id)
+        stale_ids = []
+        for droplet_id,name,public_ip,record_id in inventory_machines(loaded_config,[base_name for base_name,first,last in selectors]):
+            if series_match(name,selectors) == False:
+                continue
+            if droplet_id not in running_ids:
+                stale_ids.append(droplet_id)
+            elif record_id != None:
+                hostname = name.split(".")[0]
+                dns_known[hostname] = digitalocean.Record(domain_name=loaded_config['domain'],id=record_id,name=hostname,data=public_ip)
+        inventory_remove(loaded_config,stale_ids)
     
     fails = 0
     destroyed_list = []
+    destroyed_ids  = []
     if terse == False:
         message(banner)
-    for item in delete_machines:
+
+    # ALL is one call for everything with the tag. If that does not work, fall
+    # back to one at a time
+    tag_deleted = False
+    if "ALL" in args and N >= 1:
         try:
-            item.destroy()
-            if terse == False:
-                submsg(item.name + " destroyed")
+            destroy_by_tag(manager,vm_tag)
+            tag_deleted = True
         except:
-            warn("Could not destroy" + item.name)
-            fails += 1
-        else:
+            warn("destroy: could not destroy by tag, destroying one at a time")
+    if tag_deleted == True:
+        for item in delete_machines:
             destroyed_list.append(item.name)
-            if loaded_config['domain'] != '':
-                if terse == False:
-                    submsg("[+]-Removing DNS")
-                try:
-                    remove_subdomain(loaded_config,item.name)
-                except digitalocean.NotFoundError:
-                    warn("No DNS for entry:" + item.name)
-                    fails += 1
-                except:
-                    warn("Could not remove DNS entry for " + item.name)
-                    fails += 1
+            destroyed_ids.append(item.id)
+            if terse == False:
+                submsg(item.name + " destroyed")
+    elif N >= 1:
+        destroyed_list,destroyed_ids,fails = destroy_machine_list(loaded_config,delete_machines,terse)
+    inventory_remove(loaded_config,destroyed_ids)
+
+    # Remove DNS for everything destroyed, from one listing of the domain
+    if loaded_config['domain'] != '' and len(destroyed_list) >= 1:
+        fails += remove_machine_dns(loaded_config,destroyed_list,dns_known,terse)
             
+    if finish == False:
+        if terse == True and len(destroyed_list) >= 1:
+            print(",".join(destroyed_list))
+        return fails
     if fails >= 1:
         if terse == False:
             output = "Done, but with %s failures" % str(fails)
@@ -841,15 +2501,375 @@ def destroy_machines(loaded_config,args=[],terse=False):
             print(output)
         sys.exit(0)
 
+def scale_machines(loaded_config,N,terse=False,expires=None):
+    '''the scale command. Make the base-name series exactly sequence 0 to N-1.
+    Only the missing sequence numbers are spawned, and everything at N or
+    above is destroyed, highest first'''
+    manager   = check_and_connect(loaded_config)
+    base_name = loaded_config['base-name']
+    if len(base_name) < 1:
+        exit_with_error(2,"scale: base-name needs to be at least one char for this to work!")
+    try:
+        N = int(N)
+    except:
+        exit_with_error(2,"scale: N needs to be an interger")
+    if N < 0:
+        exit_with_error(2,"scale: N can't be less than zero")
+
+    # what is there now, from one pass over the tagged droplets
+    existing = set()
+    try:
+        for page in iter_machine_pages(loaded_config,manager):
+            for machine in page:
+                sequence = get_sequence(machine.name.split(".")[0],base_name)
+                if sequence != None:
+                    existing.add(sequence)
+    except digitalocean.DataReadError:
+        exit_with_error(2,"scale: DataReadError, check settings and try again")
+
+    missing = []
+    for i in range(N):
+        if i not in existing:
+            missing.append(i)
+    surplus = []
+    for sequence in existing:
+        if sequence >= N:
+            surplus.append(sequence)
+
+    if terse == False:
+        message("Scaling machine series: %s from %s to %s machine(s)" % (base_name,str(len(existing)),str(N)))
+    if len(missing) == 0 and len(surplus) == 0:
+        if terse == False:
+            message("Nothing to do")
+        sys.exit(0)
+
+    fails = 0
+    if len(surplus) >= 1:
+        destroy_range = base_name + "[" + str(N) + "-" + str(max(surplus)) + "]"
+        # we just listed the series from the API, don't go by the inventory
+        fails = destroy_machines(loaded_config,[destroy_range],terse,finish=False,use_inventory=False)
+    if len(missing) >= 1:
+        fails += spawn_machines(loaded_config,N,terse,sequence_list=missing,expires=expires,finish=False)
+    if fails >= 1:
+        if terse == False:
+            message("Done, but with %s failures" % str(fails))
+        sys.exit(1)
+    if terse == False:
+        message("Done")
+    sys.exit(0)
+
+def reap_once(loaded_config,manager,terse=False):
+    '''one reap pass. Finds expired droplets with one listing of the tag, and
+    destroys them and their DNS. returns names destroyed and failures'''
+    now      = time.time()
+    expired  = []
+    for page in iter_machine_pages(loaded_config,manager):
+        for machine in page:
+            if machine.expires != None and machine.expires <= now:
+                expired.append(machine)
+    if len(expired) == 0:
+        return [],0
+    if terse == False:
+        message("Reaping " + str(len(expired)) + " expired machine(s)")
+    delete_machines = []
+    for machine in expired:
+        delete_machines.append(digitalocean.Droplet(token=loaded_config['api-key'],id=machine.id,name=machine.name,_session=api_session))
+    destroyed_list,destroyed_ids,fails = destroy_machine_list(loaded_config,delete_machines,terse)
+    inventory_remove(loaded_config,destroyed_ids)
+
+    # machines may have been spawned with other domains, go by hostname
+    by_domain = {}
+    for name in destroyed_list:
+        if "." in name:
+            domain = name.split(".",1)[1]
+            if domain not in by_domain:
+                by_domain[domain] = []
+            by_domain[domain].append(name)
+    for domain in by_domain:
+        domain_config = dict(loaded_config)
+        domain_config['domain'] = domain
+        fails += remove_machine_dns(domain_config,by_domain[domain],terse=terse)
+    return destroyed_list,fails
+
+def reap_machines(loaded_config,interval=None,terse=False):
+    '''the reap command. Destroy machines spawned with --ttl or --until that
+    are past their expiry. Runs once, or with interval, every interval until
+    interrupted'''
+    manager = check_and_connect(loaded_config)
+    if interval == None:
+        try:
+            destroyed_list,fails = reap_once(loaded_config,manager,terse)
+        except digitalocean.DataReadError:
+            exit_with_error(1,"reap: could NOT get list of machines, exiting")
+        if terse == True and len(destroyed_list) >= 1:
+            print(",".join(destroyed_list))
+        elif terse == False and len(destroyed_list) == 0 and fails == 0:
+            message("No expired machines")
+        if fails >= 1:
+            if terse == False:
+                message("Done, but with %s failures" % str(fails))
+            sys.exit(1)
+        if terse == False and len(destroyed_list) >= 1:
+            message("Done")
+        sys.exit(0)
+
+    seconds = parse_duration(interval)
+    if seconds == None:
+        exit_with_error(2,"reap: can't read interval " + interval + ", use a number of seconds or a suffix like 30s, 5m, 1h")
+    if terse == False:
+        message("Reaping expired machines every " + interval + ", Ctrl-C to stop")
+    try:
+        while True:
+            started = time.time()
+            try:
+                destroyed_list,fails = reap_once(loaded_config,manager,terse)
+            except Exception as e:
+                warn("reap: pass failed, trying again next interval: " + str(e))
+            else:
+                if terse == True and len(destroyed_list) >= 1:
+                    print(",".join(destroyed_list))
+                elif fails >= 1:
+                    warn("reap: " + str(fails) + " failure(s), trying again next interval")
+                sys.stdout.flush()
+            time.sleep(max(seconds - (time.time() - started),0))
+    except KeyboardInterrupt:
+        if terse == False:
+            message("Stopped")
+        sys.exit(0)
+
+def get_collect_url(loaded_config):
+    '''collect-url, checked. Droplets POST results under it'''
+    collect_url = loaded_config['collect-url']
+    url_parts   = urllib.parse.urlsplit(collect_url)
+    if url_parts.scheme != "http" or url_parts.hostname == None:
+        exit_with_error(2,"collect-url must be http://HOST:PORT/, an address droplets can reach this computer at")
+    try:
+        url_parts.port
+    except ValueError:
+        exit_with_error(2,"collect-url has a bad port: " + collect_url)
+    return collect_url.rstrip("/") + "/"
+
+def get_collect_token(loaded_config):
+    '''token droplets in the base-name series use to send results. Made from a
+    secret in the config dir, so spawn, scale and collect all come up with
+    the same one without saving it anywhere'''
+    import hmac,secrets
+    key_file = os.getenv("HOME") + "/.config/harbor-wave/" + collect_key_file_name
+    try:
+        if os.path.exists(key_file) == False:
+            file_obj = os.fdopen(os.open(key_file,os.O_WRONLY|os.O_CREAT|os.O_EXCL,0o600),"w")
+            file_obj.write(secrets.token_hex(32))
+            file_obj.close()
+        file_obj = open(key_file,"r")
+        secret = file_obj.read().strip()
+        file_obj.close()
+    except OSError as e:
+        exit_with_error(1,"could not read or make " + key_file + ": " + str(e))
+    series = loaded_config['tag'] + ":" + loaded_config['base-name']
+    return hmac.new(secret.encode(),series.encode(),hashlib.sha256).hexdigest()[:32]
+
+class result_receiver:
+    '''HTTP server for collect, on asyncio so hundreds of droplets can send
+    at once. Droplets POST /result/BASE-NAME/SEQUENCE?exit=CODE with the token
+    as a Bearer Authorization header, and the result as the body, which is
+    written to disk as it comes in. url_path is the path of collect-url, and
+    comes before /result, i.e. /hw/result/..., for collect behind a proxy'''
+    chunk_size   = 65536
+    read_timeout = 60
+
+    def __init__(self,base_name,token,results_dir,total=None,terse=False,url_path="/"):
+        self.base_name   = base_name
+        self.url_path    = url_path.strip("/").split("/")
+        if self.url_path == [""]:
+            self.url_path = []
+        self.token       = token
+        self.results_dir = results_dir
+        self.total       = total
+        self.terse       = terse
+        # sequence:(exit code,bytes)
+        self.results     = {}
+        self.done        = None
+
+    async def reply(self,writer,code,reason,data):
+        body = json.dumps(data).encode()
+        head = "HTTP/1.1 " + str(code) + " " + reason + "\r\nContent-Type: application/json\r\nContent-Length: " + str(len(body)) + "\r\nConnection: close\r\n\r\n"
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def handle(self,reader,writer):
+        import asyncio
+        try:
+            await asyncio.wait_for(self.handle_request(reader,writer),self.read_timeout)
+        except (asyncio.TimeoutError,ConnectionError,ValueError,UnicodeDecodeError):
+            pass
+        except asyncio.CancelledError:
+            # we have them all and are shutting down, drop uploads still going
+            pass
+        except OSError as e:
+            # disk full, permissions, and such. Tell the droplet, so it tries again
+            warn("collect: could not save result: " + str(e))
+            try:
+                await self.reply(writer,500,"Internal Server Error",{"message":"could not save result"})
+            except OSError:
+                pass
+        finally:
+            writer.close()
+
+    async def handle_request(self,reader,writer):
+        import hmac
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n",b"\n",b""):
+                break
+            name,value = line.decode("latin-1").split(":",1)
+            headers[name.strip().lower()] = value.strip()
+        if len(request_line) != 3 or request_line[0] != "POST":
+            return await self.reply(writer,405,"Method Not Allowed",{"message":"POST results to /result/BASE-NAME/SEQUENCE"})
+        url_parts = urllib.parse.urlsplit(request_line[1])
+        path      = url_parts.path.strip("/").split("/")
+        query     = urllib.parse.parse_qs(url_parts.query)
+        # take off the collect-url path, if it has one
+        if path[:len(self.url_path)] != self.url_path:
+            return await self.reply(writer,404,"Not Found",{"message":"POST results to /result/BASE-NAME/SEQUENCE"})
+        path = path[len(self.url_path):]
+        if len(path) != 3 or path[0] != "result" or path[2].isdigit() == False:
+            return await self.reply(writer,404,"Not Found",{"message":"POST results to /result/BASE-NAME/SEQUENCE"})
+        # harborwave_report.py quotes the base-name
+        path[1] = urllib.parse.unquote(path[1])
+        if path[1] != self.base_name:
+            return await self.reply(writer,404,"Not Found",{"message":"not collecting for " + path[1]})
+        if hmac.compare_digest(headers.get("authorization",""),"Bearer " + self.token) == False:
+            return await self.reply(writer,401,"Unauthorized",{"message":"bad token"})
+        if "content-length" not in headers:
+            return await self.reply(writer,411,"Length Required",{"message":"Content-Length needed"})
+        sequence  = int(path[2])
+        exit_code = None
+        if "exit" in query and query['exit'][0].lstrip("-").isdigit():
+            exit_code = int(query['exit'][0])
+        if self.total == None and headers.get("x-harborwave-total-vms","").isdigit():
+            self.total = int(headers['x-harborwave-total-vms'])
+        if headers.get("expect","").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+
+        # stream the body to a temp file, and only move it in place when all
+        # of it is here. Each upload gets its own temp file, so two for the
+        # same sequence can't write over each other
+        import tempfile
+        left      = int(headers['content-length'])
+        out_file  = os.path.join(self.results_dir,str(sequence) + ".out")
+        temp_fd,temp_file = tempfile.mkstemp(dir=self.results_dir,prefix="." + str(sequence) + ".",suffix=".part")
+        file_obj  = os.fdopen(temp_fd,"wb")
+        try:
+            while left > 0:
+                chunk = await reader.read(min(left,self.chunk_size))
+                if chunk == b"":
+                    raise ConnectionError("droplet went away")
+                file_obj.write(chunk)
+                left -= len(chunk)
+            file_obj.close()
+        except:
+            file_obj.close()
+            os.unlink(temp_file)
+            raise
+        os.replace(temp_file,out_file)
+        size   = int(headers['content-length'])
+        status = {"sequence":sequence,"exit":exit_code,"bytes":size,"hostname":headers.get("x-harborwave-hostname",""),"received":datetime.now().isoformat()}
+        temp_fd,temp_file = tempfile.mkstemp(dir=self.results_dir,prefix="." + str(sequence) + ".",suffix=".part")
+        file_obj = os.fdopen(temp_fd,"w")
+        file_obj.write(json.dumps(status))
+        file_obj.close()
+        os.replace(temp_file,os.path.join(self.results_dir,str(sequence) + ".json"))
+        await self.reply(writer,200,"OK",{"message":"ok"})
+        self.add_result(sequence,exit_code,size)
+
+    def add_result(self,sequence,exit_code,size):
+        '''count a result in, print progress, and stop when we have them all'''
+        again = sequence in self.results
+        self.results[sequence] = (exit_code,size)
+        if self.terse == True:
+            print(str(sequence) + "," + str(exit_code) + "," + str(size),flush=True)
+        else:
+            total = "?"
+            if self.total != None:
+                total = str(self.total)
+            out_line = "[" + str(len(self.results)) + "/" + total + "] " + self.base_name + str(sequence) + " exit " + str(exit_code) + ", " + str(size) + " bytes"
+            if again == True:
+                out_line += ", again"
+            submsg(out_line)
+        if self.total != None and len(self.results) >= self.total:
+            self.done.set()
+
+    async def serve(self,host,port):
+        import asyncio
+        self.done = asyncio.Event()
+        server = await asyncio.start_server(self.handle,host,port,backlog=1024)
+        async with server:
+            await self.done.wait()
+
+def collect_results(loaded_config,N=None,terse=False):
+    '''the collect command. Listen on the collect-url port for results from
+    the base-name series, until N, or total_vms from the first report, have
+    come in, or Ctrl-C. Results go in ./harborwave-results/BASE-NAME/'''
+    if loaded_config['collect-url'] == "":
+        exit_with_error(2,"collect: collect-url is not set, set it to http://HOST:PORT/ and spawn with it, see help config")
+    if len(loaded_config['base-name']) < 1:
+        exit_with_error(2,"collect: base-name needs to be at least one char for this to work!")
+    if N != None:
+        try:
+            N = int(N)
+        except ValueError:
+            exit_with_error(2,"collect: N needs to be an interger")
+    collect_url = get_collect_url(loaded_config)
+    port        = urllib.parse.urlsplit(collect_url).port or 80
+    results_dir = os.path.join(collect_dir_name,loaded_config['base-name'])
+    try:
+        os.makedirs(results_dir,exist_ok=True)
+    except OSError as e:
+        exit_with_error(1,"collect: could not make " + results_dir + ": " + str(e))
+
+    import asyncio
+    url_path = urllib.parse.urlsplit(collect_url).path
+    receiver = result_receiver(loaded_config['base-name'],get_collect_token(loaded_config),results_dir,N,terse,url_path)
+    if terse == False:
+        message("Collecting results for " + loaded_config['base-name'] + " on port " + str(port) + ", into " + results_dir + "/. Ctrl-C to stop")
+    try:
+        asyncio.run(receiver.serve("",port))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        exit_with_error(1,"collect: could not listen on port " + str(port) + ": " + str(e))
+
+    failed  = []
+    for sequence in sorted(receiver.results):
+        if receiver.results[sequence][0] != 0:
+            failed.append(str(sequence))
+    missing = []
+    if receiver.total != None:
+        for sequence in range(receiver.total):
+            if sequence not in receiver.results:
+                missing.append(str(sequence))
+    if terse == False:
+        message("Collected " + str(len(receiver.results)) + " result(s)")
+        if len(failed) >= 1:
+            warn("collect: non-zero exit from sequence " + ",".join(failed))
+        if len(missing) >= 1:
+            warn("collect: no result from sequence " + ",".join(missing))
+    if len(failed) >= 1 or len(missing) >= 1:
+        sys.exit(1)
+    sys.exit(0)
+
 def set_config(config_dir,loaded_config,item,value):
     '''update config, vars loaded_config is a dict of values to write, the rest should be self explanitory'''
     api_file_name    = "api-key"
     config_file_name = "harbor-wave.cfg"
     api_file         = config_dir + "/" + api_file_name
     config_file      = config_dir + "/" + config_file_name
-    set_item_str     = ["api-key","domain", "base-name","payload","project","size","region","template","tag"]
-    set_item_int     = ["ssh-key-n"]
-    set_item_bool    = ["wait"]
+    set_item_str     = ["api-key","domain", "base-name","payload","project","size","region","template","tag","payload-encoding","payload-shard","collect-url"]
+    set_item_int     = ["ssh-key-n","parallel"]
+    set_item_bool    = ["wait","multi-create"]
     all_set_items    = set_item_str + set_item_int + set_item_bool
     
     # Null value check
@@ -879,6 +2899,11 @@ def set_config(config_dir,loaded_config,item,value):
         else:
             exit_with_error(2,"set: invalid value for " + item + ". must be True/False")
 
+    if item == "payload-encoding" and value not in payload_encodings:
+        exit_with_error(2,"set: payload-encoding must be one of: " + ", ".join(payload_encodings))
+    if item == "payload-shard" and value not in payload_shard_modes:
+        exit_with_error(2,"set: payload-shard must be one of: " + ", ".join(payload_shard_modes))
+
     # if item is an api key, check before set:
     if item == "api-key":
         if check_api_key(value) != True:
@@ -902,6 +2927,12 @@ def set_config(config_dir,loaded_config,item,value):
     except:
         exit_with_error(2,"set: Could not write to config file")
 
+def get_account(loaded_config):
+    '''Get the account object, over the shared session'''
+    account = digitalocean.Account(token=loaded_config['api-key'],_session=api_session)
+    account.load()
+    return account
+
 def check_and_print_config(loaded_config,terse=False):
     '''Check Configuration and print results of each item to the screen'''
     errors    = 0
@@ -961,12 +2992,24 @@ def check_and_print_config(loaded_config,terse=False):
     
     ## Online Checks
     # Open a sessions
-    manager = digitalocean.Manager(token=api_key)
+    open_api_session(loaded_config)
+    manager = digitalocean.Manager(token=api_key,_session=api_session)
     
+    # None of the lookups depend on each other, so fire them all off at once.
+    # All of them finish before anything prints, then results print in the
+    # usual order
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        account_future  = pool.submit(get_account,loaded_config)
+        regions_future  = pool.submit(get_catalog,loaded_config,manager,"regions")
+        ssh_keys_future = pool.submit(get_catalog,loaded_config,manager,"ssh-keys")
+        projects_future = pool.submit(get_catalog,loaded_config,manager,"projects")
+        images_future   = pool.submit(get_catalog,loaded_config,manager,"images")
+        domains_future  = pool.submit(get_catalog,loaded_config,manager,"domains")
+
     # Check API Key
     out_line = "Account:\t".expandtabs(tab_space)
     try:
-        account   = manager.get_account()
+        account   = account_future.result()
         out_line += OK
     except:
         account   = None
@@ -976,12 +3019,17 @@ def check_and_print_config(loaded_config,terse=False):
         sys.exit(1)
         
     # Reigons
-    regions_objs = manager.get_all_regions()
+    regions_objs = regions_future.result()
     region_list  = []
     for item in regions_objs:
         region_list.append(item.slug)
     out_line="Region:\t".expandtabs(tab_space)
-    if loaded_config['region'] in region_list:
+    region_weights = parse_regions(loaded_config['region'])
+    use_regions    = []
+    if region_weights != None:
+        use_regions = [region for region,weight in region_weights]
+    bad_regions = [region for region in use_regions if region not in region_list]
+    if region_weights != None and len(bad_regions) == 0:
         out_line += OK
     else:
         out_line += INVALID
@@ -989,7 +3037,7 @@ def check_and_print_config(loaded_config,terse=False):
     print(out_line)
     
     # SSH Key
-    ssh_keys_obj = manager.get_all_sshkeys()
+    ssh_keys_obj = ssh_keys_future.result()
     out_line="SSH-Key-N:\t".expandtabs(tab_space)
     # check the key id is an INT, and within range of key ids
     if type(loaded_config['ssh-key-n']) != int:
@@ -1005,7 +3053,7 @@ def check_and_print_config(loaded_config,terse=False):
     print(out_line)
     
     # Project
-    projects_objs = manager.get_all_projects()
+    projects_objs = projects_future.result()
     project_list  = []
     for item in projects_objs:
         project_list.append(item.name)
@@ -1018,21 +3066,28 @@ def check_and_print_config(loaded_config,terse=False):
     print(out_line)
     
     # Template
-    images_objs = manager.get_my_images()
+    images_objs = images_future.result()
     template_list = []
     out_line = "Template:\t".expandtabs(tab_space)
+    template_regions = []
     for item in images_objs:
         if item.type == "custom":
             template_list.append(item.id)
-    if int(loaded_config['template']) in template_list:
-        out_line += OK
-    else:
+            if str(item.id) == str(loaded_config['template']):
+                template_regions = item.regions
+    missing_regions = [region for region in use_regions if region not in template_regions]
+    if int(loaded_config['template']) not in template_list:
         out_line += INVALID
         errors   += 1
+    elif len(missing_regions) >= 1:
+        out_line += INVALID + ", not in region(s): " + ", ".join(missing_regions)
+        errors   += 1
+    else:
+        out_line += OK
     print(out_line)
     
     # Domain
-    domains = manager.get_all_domains()
+    domains = domains_future.result()
     domain_list = []
     out_line = "Domain:\t".expandtabs(tab_space)
     for domain in domains:
@@ -1060,7 +3115,7 @@ def get_domain_obj(loaded_config):
     manager = check_and_connect(loaded_config)
     # load and check:
     try:
-        all_domains = manager.get_all_domains()
+        all_domains = get_catalog(loaded_config,manager,"domains")
     except digitalocean.DataReadError:
         exit_with_error(2,"list: DataReadError, check settings and try again")
     domain_name = loaded_config['domain']
@@ -1201,6 +3256,12 @@ def main():
     parser.add_argument("arguments", nargs="*"  ,help="Arguments for command, see above")
     parser.add_argument("-?","--help"           ,help="Show This Help Message", action="help")
     parser.add_argument("-T","--terse"          ,help="when using list or print-config, print CSV format instead of justified tab tables.\n\nFor spawn, prints a NAME:IP pair seperated by commas\n\nFor destroy, a comma seperated list of machines destroyed",action="store_true")
+    parser.add_argument("-R","--refresh"        ,help="Ignore cached regions, sizes, templates, ssh-keys, projects and domains, and get them fresh from the API",action="store_true")
+    parser.add_argument("-G","--group"          ,help="With list machines, one line per series(base-name) with count, regions, sizes, ages and burn rate, instead of one per droplet",action="store_true")
+    parser.add_argument("--watch"               ,help="With list machines or list money-left, keep running and print only what changes, every INTERVAL, i.e. 30s or 5m. Default: 10s",nargs="?",const="10s",metavar="INTERVAL")
+    parser.add_argument("--ttl"                 ,help="With spawn or scale, new machines expire after this long, i.e. 90m, 2h, 1d. A plain number is seconds. See reap",type=str)
+    parser.add_argument("--until"               ,help="With spawn or scale, new machines expire at this date-time, i.e. \"2025-06-01 18:00\", local time unless a timezone is given. See reap",type=str)
+    parser.add_argument("--trace"               ,help="Record every API request, and print a summary per endpoint and per function on exit. --trace=FILE, with the equals sign, also saves every request to FILE as JSON",nargs="?",const="",metavar="FILE")
 
     config_overrides = parser.add_argument_group("Config Overrides","Configuration Overrides, lower case")
     config_overrides.add_argument("-a","--api-key"    ,help="Digitial Ocean API key to use",type=str)
@@ -1208,14 +3269,49 @@ def main():
     config_overrides.add_argument("-g","--tag"        ,help="DO tag to use on VMs so harbor-wave can identify its VMs. default: harborwave",type=str)
     config_overrides.add_argument("-k","--ssh-key-n"  ,help="Interger: index of SSH-key to use for root(or other if so configed) access. Default is 0",type=int)
     config_overrides.add_argument("-l","--payload"    ,help="Aribtrary content that gets sent to every spawned machine via user-data in API. if FILE: is specified, local file is read and used as a payload as a string",type=str)
+    config_overrides.add_argument("--payload-encoding",help="How the payload goes in user-data: none, or gzip+base64 to compress it. Default is none",type=str)
+    config_overrides.add_argument("--payload-shard"   ,help="Split a FILE: payload in N parts, each machine gets the part for its sequence number: none, lines, bytes, or files for a directory. Default is none",type=str)
+    config_overrides.add_argument("--collect-url"     ,help="http://HOST:PORT/ droplets send results to, see collect. Blank to not send any",type=str)
     config_overrides.add_argument("-n","--base-name"  ,help="Base Name For New VMs",type=str)
     config_overrides.add_argument("-p","--project"    ,help="name of project in account where new machines spawn. If blank default is used",type=str)
     config_overrides.add_argument("-r","--region"     ,help="Region code. Specify what datacenter this goes in",type=str)
     config_overrides.add_argument("-s","--size"       ,help="Size code for new VMs",type=str)
     config_overrides.add_argument("-t","--template"   ,help="Image Template for spawning new VMs",type=str)
     config_overrides.add_argument("-w","--no-wait"    ,help="Don't wait for IP address to be assigned, return immediately. Default is to wait",action="store_true")
-
-    args = parser.parse_args()
+    config_overrides.add_argument("--parallel"        ,help="Interger: how many droplets spawn creates at once. Default is 10",type=int)
+    config_overrides.add_argument("--multi-create"    ,help="Create up to 10 droplets per API call. Droplets look up their sequence number by hostname in sequence-map",action="store_true")
+
+    # a file for --trace has to be given as --trace=FILE. A bare --trace
+    # would take the next word, i.e. "list --trace machines" or
+    # "--trace spawn 5", so it is taken out, and only turns tracing on
+    argv       = sys.argv[1:]
+    trace_flag = "--trace" in argv
+    if trace_flag == True:
+        argv = [item for item in argv if item != "--trace"]
+    # intermixed, so command arguments after an option still count, i.e.
+    # "list --watch 30s machines"
+    args = parser.parse_intermixed_args(argv)
+    if trace_flag == True and args.trace == None:
+        args.trace = ""
+    if args.refresh == True:
+        global refresh_cache
+        refresh_cache = True
+    # "list --watch machines", argparse takes machines as the interval
+    if args.watch in all_commands:
+        if args.command != None:
+            args.arguments.insert(0,args.command)
+        args.command = args.watch
+        args.watch   = "10s"
+    elif args.watch != None and parse_duration(args.watch) == None:
+        args.arguments.insert(0,args.watch)
+        args.watch = "10s"
+    if args.trace != None:
+        global api_trace
+        out_file = None
+        if args.trace != "":
+            out_file = args.trace
+        api_trace = api_tracer(out_file)
+        atexit.register(api_trace.finish)
 
     # get config from file
     config_dir = os.getenv("HOME") + "/.config/harbor-wave/"
@@ -1231,6 +3327,12 @@ def main():
         loaded_config['domain']        = args.domain
     if args.payload != None:
         loaded_config['payload']       = args.payload
+    if args.payload_encoding != None:
+        loaded_config['payload-encoding'] = args.payload_encoding
+    if args.payload_shard != None:
+        loaded_config['payload-shard'] = args.payload_shard
+    if args.collect_url != None:
+        loaded_config['collect-url']   = args.collect_url
     if args.project != None:
         loaded_config['project']       = args.project
     if args.tag != None:
@@ -1247,6 +3349,15 @@ def main():
         loaded_config['template']      = args.template
     if args.no_wait == True:
         loaded_config['wait']          = False
+    if args.parallel != None:
+        loaded_config['parallel']      = args.parallel
+    if args.multi_create == True:
+        loaded_config['multi-create']  = True
+
+    # One HTTP session for everything that talks to the API
+    if args.command in network_commands:
+        load_api_libs()
+        open_api_session(loaded_config)
 
     # Lets roll. Commands do their own checks
     if args.command == None:
@@ -1287,6 +3398,12 @@ def main():
         if option == "help":
             output_line = "list: following are valid list subcommands: machines, templates, regions, ssh-keys, sizes, domains, and money-left. See  --help for more info"
             print(output_line)
+        elif option == "machines" and args.watch != None:
+            watch_machines(loaded_config,args.watch,args.terse)
+        elif option == "money-left" and args.watch != None:
+            watch_account_balance(loaded_config,args.watch,args.terse)
+        elif option == "machines" and args.group == True:
+            list_machine_series(loaded_config,args.terse)
         elif option == "machines":
             list_machines(loaded_config,args.terse)
         elif option == "projects":
@@ -1306,11 +3423,12 @@ def main():
         else:
             exit_with_error(2,"list: Invalid option, see --help for options")
     elif args.command == "spawn":
+        expires = get_expiry(args.ttl,args.until)
         if len(args.arguments) >= 1:
             N = args.arguments[0]
-            spawn_machines(loaded_config,N,terse=args.terse)
+            spawn_machines(loaded_config,N,terse=args.terse,expires=expires)
         else:
-            spawn_machines(loaded_config,terse=args.terse)
+            spawn_machines(loaded_config,terse=args.terse,expires=expires)
     elif args.command == "destroy":
         if len(args.arguments) >= 1:
             options = args.arguments
@@ -1319,6 +3437,27 @@ def main():
         destroy_machines(loaded_config,options,terse=args.terse)
     elif args.command == "check-config":
         check_and_print_config(loaded_config,args.terse)
+    elif args.command == "scale":
+        if len(args.arguments) < 1:
+            exit_with_error(2,"scale: needs N, how many machines the series should have. See --help")
+        expires = get_expiry(args.ttl,args.until)
+        scale_machines(loaded_config,args.arguments[0],args.terse,expires)
+    elif args.command == "reap":
+        if len(args.arguments) >= 1:
+            reap_machines(loaded_config,args.arguments[0],args.terse)
+        else:
+            reap_machines(loaded_config,terse=args.terse)
+    elif args.command == "collect":
+        if len(args.arguments) >= 1:
+            collect_results(loaded_config,args.arguments[0],args.terse)
+        else:
+            collect_results(loaded_config,terse=args.terse)
+    elif args.command == "sync":
+        sync_inventory(loaded_config,args.terse)
+    elif args.command == "cache":
+        if len(args.arguments) < 1 or args.arguments[0] != "clear":
+            exit_with_error(2,"cache: valid subcommands: clear. See --help")
+        clear_cache(loaded_config,args.terse)
     else:
         exit_with_error(2,"No such command. See --help")
 